@@ -1,6 +1,9 @@
+from collections import Counter
 import fileinput
+import functools
 
 Graph = dict[str, set[str]]
+MultiGraph = dict[str, Counter[str]]
 
 # Parse
 connections = [tuple(line.rstrip().split("-")) for line in fileinput.input()]
@@ -12,26 +15,61 @@ for a, b in connections:
     graph.setdefault(b, set()).add(a)
 
 
+def contract_big_caves(graph: Graph) -> MultiGraph:
+    # Replace each big cave with the routes through it between the small caves
+    # around it, including back to the same small cave, and count how many
+    # routes join each pair of small caves.
+    # XXX: Two big caves next to each other would allow endless paths; thus,
+    # assume big caves only lead to small caves.
+    multigraph: MultiGraph = {cave: Counter() for cave in graph if cave.islower()}
+    for cave, routes in multigraph.items():
+        for n in graph[cave]:
+            if n.islower():
+                routes[n] += 1
+            else:
+                routes.update(graph[n])
+    return multigraph
+
+
+multigraph = contract_big_caves(graph)
+
+
 # Main
-def num_paths(graph: Graph, start: str, end: str, *, twice: bool = False) -> int:
-    def recursive_num_paths(
-        graph: Graph, cave: str, visited: set[str], twice: bool
-    ) -> int:
-        if cave == end:
+def num_paths(graph: MultiGraph, start: str, end: str) -> tuple[int, int]:
+    # Count the paths that visit small caves once, and those that may visit a
+    # single small cave twice.  Once a path has used its second visit, it
+    # continues like a path that may not, so both counts share one cache.
+    # Number the caves, so each cave's id is its bit in the set of caves
+    # visited.
+    caves = sorted(graph)
+    ids = {cave: i for i, cave in enumerate(caves)}
+    neighbors = [
+        [(ids[n], routes) for n, routes in graph[cave].items() if n != start]
+        for cave in caves
+    ]
+    end_id = ids[end]
+
+    @functools.cache
+    def recursive_num_paths(cave: int, visited: int, twice: bool) -> int:
+        if cave == end_id:
             return 1
 
-        if cave.islower():
-            twice &= cave not in visited
-            visited.add(cave)
+        twice &= not visited >> cave & 1
+        visited |= 1 << cave
 
-        return sum(
-            recursive_num_paths(graph, n, visited.copy(), twice)
-            for n in graph[cave]
-            if n != start and (n not in visited or twice)
-        )
+        count = 0
+        for n, routes in neighbors[cave]:
+            if not visited >> n & 1 or twice:
+                count += routes * recursive_num_paths(n, visited, twice)
+        return count
 
-    return recursive_num_paths(graph, start, set(), twice)
+    start_id = ids[start]
+    return (
+        recursive_num_paths(start_id, 0, False),
+        recursive_num_paths(start_id, 0, True),
+    )
 
 
-print("Part 1:", num_paths(graph, "start", "end"))
-print("Part 2:", num_paths(graph, "start", "end", twice=True))
+once, twice = num_paths(multigraph, "start", "end")
+print("Part 1:", once)
+print("Part 2:", twice)
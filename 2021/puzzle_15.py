@@ -1,18 +1,67 @@
+import argparse
+from array import array
 import fileinput
 import heapq
+import multiprocessing
+import resource
 import sys
 from typing import Generator
 
+
 # Parse
-cavern = [list(map(int, line.rstrip())) for line in fileinput.input()]
+def row_col(value: str) -> tuple[int, int]:
+    try:
+        row, col = map(int, value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"{value!r} is not a ROW,COL position"
+        ) from None
+    return row, col
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--engine",
+    choices=("bucket", "heapq"),
+    default="bucket",
+    help="shortest path search implementation",
+)
+parser.add_argument(
+    "--factor",
+    type=int,
+    action="append",
+    default=[],
+    help="also search the cavern expanded by FACTOR and report peak memory",
+)
+parser.add_argument(
+    "--query",
+    type=row_col,
+    action="append",
+    default=[],
+    metavar="ROW,COL",
+    help="report the lowest risk and path length to ROW,COL in the 5x cavern",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+for factor in args.factor:
+    if factor < 1:
+        parser.error(f"factor {factor} is not a positive number")
+
+cavern = [list(map(int, line.rstrip())) for line in fileinput.input(args.files)]
 
 # Init
 CAVERN_ROWS = len(cavern)
 CAVERN_COLS = len(cavern[0])
 
+MAX_RISK = 9
+
+# Search states of a position besides its risk so far.
+UNREACHED = 0
+SETTLED = 0xFF
+
 
 # Main
-def calculate_min_risk(
+def heapq_min_risk(
     cavern: list[list[int]], start: tuple[int, int], end: tuple[int, int]
 ) -> int:
     rows = len(cavern)
@@ -51,6 +100,228 @@ def calculate_min_risk(
     return risks[end]
 
 
+class TiledCavern:
+    """A cavern tile repeated `factor` times in both directions.
+
+    Risks are derived from the original tile rather than materialized for the
+    whole cavern, and are indexed by position in a grid with a one position
+    border of zero risk, which marks a position as impassable.
+    """
+
+    # PUBLIC DATA
+    rows: int
+    cols: int
+    width: int
+    # The risks of each row of the grid, border included.
+    padded_rows: list[bytes]
+
+    # CREATORS
+    def __init__(self, tile: list[list[int]], factor: int = 1):
+        tile_rows = len(tile)
+        self.rows = tile_rows * factor
+        self.cols = len(tile[0]) * factor
+        self.width = self.cols + 2
+
+        # A tiled row only depends on its row within the tile and the tile's
+        # distance from the original tile modulo MAX_RISK; share one padded
+        # copy of each among all of the rows that repeat it.
+        shifted_rows = [
+            [
+                bytes(
+                    [0]
+                    + [
+                        1 + (risk + shift + col_tile - 1) % MAX_RISK
+                        for col_tile in range(factor)
+                        for risk in row
+                    ]
+                    + [0]
+                )
+                for row in tile
+            ]
+            for shift in range(min(factor, MAX_RISK))
+        ]
+        border = bytes(self.width)
+        self.padded_rows = [border]
+        for row_tile in range(factor):
+            self.padded_rows.extend(shifted_rows[row_tile % MAX_RISK])
+        self.padded_rows.append(border)
+
+    # ACCESSORS
+    def __getitem__(self, node: int) -> int:
+        x, y = divmod(node, self.width)
+        return self.padded_rows[x][y]
+
+    def node(self, xy: tuple[int, int]) -> int:
+        return (xy[0] + 1) * self.width + (xy[1] + 1)
+
+    def xy(self, node: int) -> tuple[int, int]:
+        x, y = divmod(node, self.width)
+        return (x - 1, y - 1)
+
+
+def settle_bucket(
+    cavern: TiledCavern,
+    state: bytearray,
+    buckets: list[list[int]],
+    risk: int,
+    settled: list[int] | None = None,
+) -> None:
+    """Settle the positions queued with `risk` and queue their neighbors.
+
+    Dial's algorithm: edge weights are bounded by MAX_RISK, so every queued
+    position is within MAX_RISK of the current risk and a ring of buckets
+    indexed by risk replaces the heap.  For the same reason, `state` holds one
+    byte per position: UNREACHED, SETTLED, or its risk so far modulo the number
+    of buckets, plus one.  Settled positions are appended to `settled`.
+    """
+    width = cavern.width
+    padded_rows = cavern.padded_rows
+    ring = len(buckets)
+    bucket = buckets[risk % ring]
+    while bucket:
+        cur = bucket.pop()
+        if state[cur] == SETTLED:
+            # Stale entry; a lower risk was already found.
+            continue
+        state[cur] = SETTLED
+        if settled is not None:
+            settled.append(cur)
+
+        x, y = divmod(cur, width)
+        row = padded_rows[x]
+        for n, neighbor_risk in (
+            (cur - width, padded_rows[x - 1][y]),
+            (cur - 1, row[y - 1]),
+            (cur + 1, row[y + 1]),
+            (cur + width, padded_rows[x + 1][y]),
+        ):
+            neighbor_state = state[n]
+            if neighbor_state == SETTLED or not neighbor_risk:
+                continue
+            if (
+                neighbor_state == UNREACHED
+                or (neighbor_state - 1 - risk) % ring > neighbor_risk
+            ):
+                slot = (risk + neighbor_risk) % ring
+                state[n] = 1 + slot
+                buckets[slot].append(n)
+
+
+def bucket_min_risk(
+    cavern: TiledCavern, start: tuple[int, int], end: tuple[int, int]
+) -> int:
+    source = cavern.node(start)
+    target = cavern.node(end)
+
+    state = bytearray(cavern.width * (cavern.rows + 2))
+    buckets: list[list[int]] = [[] for _ in range(MAX_RISK + 1)]
+    # XXX: Don't count the starting position.  Only positions entered.
+    state[source] = 1
+    buckets[0].append(source)
+
+    risk = 0
+    while any(buckets):
+        settle_bucket(cavern, state, buckets, risk)
+        if state[target] == SETTLED:
+            return risk
+        risk += 1
+
+    return sys.maxsize
+
+
+class LowestRiskTree:
+    """Lowest total risk from a start position to every other position.
+
+    The search only goes as far as needed to answer a query and resumes from
+    where it left off for the next one, so any number of queries against the
+    same start cost at most one full search.
+    """
+
+    # PUBLIC DATA
+    cavern: TiledCavern
+    start: tuple[int, int]
+
+    # DATA
+    _source: int
+    _state: bytearray
+    _dist: "array[int]"
+    _buckets: list[list[int]]
+    _settled: list[int]
+    _risk: int
+
+    # CREATORS
+    def __init__(self, cavern: TiledCavern, start: tuple[int, int]):
+        self.cavern = cavern
+        self.start = start
+
+        self._source = cavern.node(start)
+        self._state = bytearray(cavern.width * (cavern.rows + 2))
+        self._dist = array("q", [sys.maxsize]) * len(self._state)
+        self._buckets = [[] for _ in range(MAX_RISK + 1)]
+        self._settled = []
+        # XXX: Don't count the starting position.  Only positions entered.
+        self._state[self._source] = 1
+        self._buckets[0].append(self._source)
+        # Every position with a lower risk than this has been settled.
+        self._risk = 0
+
+    # MANIPULATORS
+    def _explore(self, target: int) -> bool:
+        while self._state[target] != SETTLED:
+            if not any(self._buckets):
+                return False
+
+            settle_bucket(
+                self.cavern, self._state, self._buckets, self._risk, self._settled
+            )
+            for n in self._settled:
+                self._dist[n] = self._risk
+            self._settled.clear()
+            self._risk += 1
+
+        return True
+
+    def risk(self, end: tuple[int, int]) -> int:
+        target = self.cavern.node(end)
+        if not self._explore(target):
+            return sys.maxsize
+        return self._dist[target]
+
+    def path(self, end: tuple[int, int]) -> list[tuple[int, int]]:
+        cavern = self.cavern
+        cur = cavern.node(end)
+        if not self._explore(cur):
+            return []
+
+        # Walk back through settled neighbors whose risk accounts for entering
+        # the current position.
+        dist = self._dist
+        neighbor_offsets = (-cavern.width, -1, 1, cavern.width)
+        result = [end]
+        while cur != self._source:
+            cur = next(
+                n
+                for n in (cur + offset for offset in neighbor_offsets)
+                if dist[n] + cavern[cur] == dist[cur]
+            )
+            result.append(cavern.xy(cur))
+        result.reverse()
+        return result
+
+
+def calculate_min_risk(
+    cavern: list[list[int]],
+    start: tuple[int, int],
+    end: tuple[int, int],
+    *,
+    factor: int = 1,
+    engine: str = "bucket",
+) -> int:
+    if engine == "heapq":
+        return heapq_min_risk(expand_cave(cavern, factor), start, end)
+    return bucket_min_risk(TiledCavern(cavern, factor), start, end)
+
+
 def expand_cave(cavern: list[list[int]], factor: int) -> list[list[int]]:
     rows = len(cavern)
     cols = len(cavern[0])
@@ -68,10 +339,51 @@ def expand_cave(cavern: list[list[int]], factor: int) -> list[list[int]]:
     return result
 
 
-risk = calculate_min_risk(cavern, (0, 0), (CAVERN_ROWS - 1, CAVERN_COLS - 1))
+risk = calculate_min_risk(
+    cavern, (0, 0), (CAVERN_ROWS - 1, CAVERN_COLS - 1), engine=args.engine
+)
 print("Part 1:", risk)
 
 risk_5x = calculate_min_risk(
-    expand_cave(cavern, 5), (0, 0), ((CAVERN_ROWS * 5) - 1, (CAVERN_COLS * 5) - 1)
+    cavern,
+    (0, 0),
+    ((CAVERN_ROWS * 5) - 1, (CAVERN_COLS * 5) - 1),
+    factor=5,
+    engine=args.engine,
 )
 print("Part 2:", risk_5x)
+
+if args.query:
+    lowest_risk_tree = LowestRiskTree(TiledCavern(cavern, 5), (0, 0))
+    for end in args.query:
+        row, col = end
+        if not (0 <= row < CAVERN_ROWS * 5 and 0 <= col < CAVERN_COLS * 5):
+            parser.error(f"query {end} is outside of the 5x cavern")
+        path = lowest_risk_tree.path(end)
+        print(
+            f"Query {end}:",
+            lowest_risk_tree.risk(end),
+            f"({len(path) - 1} steps)",
+        )
+
+
+def min_risk_and_peak_memory(factor: int, engine: str) -> tuple[int, int]:
+    risk = calculate_min_risk(
+        cavern,
+        (0, 0),
+        ((CAVERN_ROWS * factor) - 1, (CAVERN_COLS * factor) - 1),
+        factor=factor,
+        engine=engine,
+    )
+    return risk, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+if args.factor:
+    # XXX: Search each factor in a fresh process so its peak resident memory
+    # isn't masked by an earlier, larger search.
+    with multiprocessing.get_context("fork").Pool(1, maxtasksperchild=1) as pool:
+        for factor in args.factor:
+            risk_nx, peak_memory = pool.apply(
+                min_risk_and_peak_memory, (factor, args.engine)
+            )
+            print(f"{factor}x:", risk_nx, f"(peak memory: {peak_memory} KiB)")
@@ -1,19 +1,60 @@
 from __future__ import annotations
 
+import argparse
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
 from dataclasses import dataclass
 import fileinput
 import functools
 import itertools
 import math
+import multiprocessing
+import os
 from typing import Any
+from typing import Iterator
 from typing import Optional
 
 # Parse
-hw_list = [eval(line.rstrip()) for line in fileinput.input()]
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--engine",
+    choices=("flat", "tree"),
+    default="flat",
+    help="snailfish number representation",
+)
+parser.add_argument(
+    "--stats",
+    action="store_true",
+    help="report the number of nodes visited per addition",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="number of forked processes adding pairs of flat numbers "
+    "(default: number of CPUs)",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+if args.workers is not None and args.workers < 1:
+    parser.error(f"workers {args.workers} is not a positive number")
+
+hw_lines = [line.rstrip() for line in fileinput.input(args.files)]
 
 # Init
 EXPLODE_DEPTH = 4
 SPLIT_THRESHOLD = 10
+PAIRS_PER_TASK = 256
+
+# Magnitude each regular number is worth at its place in a snailfish number
+# where every regular number is nested as deep as it can be, from most to least.
+MAGNITUDE_WEIGHTS = sorted(
+    (math.prod(place) for place in itertools.product((3, 2), repeat=EXPLODE_DEPTH)),
+    reverse=True,
+)
 
 
 @dataclass
@@ -42,6 +83,32 @@ def list2tree(lst: Any, parent: Optional[Node] = None) -> Node:
     return n
 
 
+# A snailfish number flattened into its regular numbers from left to right,
+# along with how many pairs each is nested inside of.
+FlatNumber = tuple[list[int], list[int]]
+
+
+def parse_flat(line: str) -> FlatNumber:
+    values = []
+    depths = []
+    depth = 0
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif char.isdigit():
+            start = i
+            while i + 1 < len(line) and line[i + 1].isdigit():
+                i += 1
+            values.append(int(line[start : i + 1]))
+            depths.append(depth)
+        i += 1
+    return values, depths
+
+
 # Main
 def rightmost_val(node: Node) -> Node:
     if node.right is not None:
@@ -103,41 +170,110 @@ def split(node: Node) -> None:
     node.val = None
 
 
-def snailfish_explode(node: Optional[Node], depth: int = 0) -> bool:
-    if node is None:
-        return False
-
-    if depth >= EXPLODE_DEPTH and node.val is None:
+@dataclass
+class ReduceStats:
+    additions: int = 0
+    visited: int = 0
+
+
+def next_leaf(node: Node, depth: int, stats: ReduceStats) -> tuple[Node | None, int]:
+    # Climb out of right subtrees, then go down the left of the next one over.
+    while node.parent is not None and node is node.parent.right:
+        node = node.parent
+        depth -= 1
+        stats.visited += 1
+    if node.parent is None:
+        return None, depth
+    assert node.parent.right is not None
+    node = node.parent.right
+    stats.visited += 1
+    while node.left is not None:
+        node = node.left
+        depth += 1
+        stats.visited += 1
+    return node, depth
+
+
+def prev_leaf(node: Node, depth: int, stats: ReduceStats) -> tuple[Node | None, int]:
+    # Climb out of left subtrees, then go down the right of the next one over.
+    while node.parent is not None and node is node.parent.left:
+        node = node.parent
+        depth -= 1
+        stats.visited += 1
+    if node.parent is None:
+        return None, depth
+    assert node.parent.left is not None
+    node = node.parent.left
+    stats.visited += 1
+    while node.right is not None:
+        node = node.right
+        depth += 1
+        stats.visited += 1
+    return node, depth
+
+
+def snailfish_explode(node: Node, stats: ReduceStats, depth: int = 0) -> None:
+    # Exploding only adds to regular numbers, which never nests a pair any
+    # deeper, so a single pass from left to right explodes them all.
+    stats.visited += 1
+    if node.val is not None:
+        return
+    if depth >= EXPLODE_DEPTH:
         explode(node)
-        return True
-
-    return snailfish_explode(node.left, depth + 1) or snailfish_explode(
-        node.right, depth + 1
-    )
-
-
-def snailfish_split(node: Optional[Node]) -> bool:
-    if node is None:
-        return False
+        return
+    assert node.left is not None
+    assert node.right is not None
+    snailfish_explode(node.left, stats, depth + 1)
+    snailfish_explode(node.right, stats, depth + 1)
+
+
+def snailfish_split(root: Node, stats: ReduceStats) -> None:
+    # Every regular number left of the current one is less than the split
+    # threshold, so after each action resume from the leftmost regular number
+    # that it could have changed rather than from the root.
+    leaf = root
+    depth = 0
+    while leaf.left is not None:
+        leaf = leaf.left
+        depth += 1
+        stats.visited += 1
+
+    node: Node | None = leaf
+    while node is not None:
+        stats.visited += 1
+        assert node.val is not None
+        if node.val < SPLIT_THRESHOLD:
+            node, depth = next_leaf(node, depth, stats)
+            continue
 
-    if node.val is not None and node.val >= SPLIT_THRESHOLD:
         split(node)
-        return True
+        if depth < EXPLODE_DEPTH:
+            assert node.left is not None
+            node = node.left
+            depth += 1
+            continue
 
-    return snailfish_split(node.left) or snailfish_split(node.right)
+        # The split nested a pair too deep, which only changes its neighbors.
+        explode(node)
+        prev_node, prev_depth = prev_leaf(node, depth, stats)
+        if prev_node is not None:
+            node, depth = prev_node, prev_depth
 
 
-def snailfish_reduce(root: Node) -> Node:
-    while snailfish_explode(root) or snailfish_split(root):
-        pass
+def snailfish_reduce(root: Node, stats: ReduceStats) -> Node:
+    snailfish_explode(root, stats)
+    snailfish_split(root, stats)
     return root
 
 
-def snailfish_add(lhs: Node, rhs: Node) -> Node:
+def snailfish_add(lhs: Node, rhs: Node, stats: ReduceStats | None = None) -> Node:
     node = Node(left=lhs, right=rhs)
     lhs.parent = node
     rhs.parent = node
-    result = snailfish_reduce(node)
+    if stats is None:
+        stats = ReduceStats()
+    stats.additions += 1
+    result = snailfish_reduce(node, stats)
     return result
 
 
@@ -149,19 +285,217 @@ def snailfish_magnitude(node: Node) -> int:
     return snailfish_magnitude(node.left) * 3 + snailfish_magnitude(node.right) * 2
 
 
-snail_sum = functools.reduce(snailfish_add, map(list2tree, hw_list))
-print("Part 1:", snailfish_magnitude(snail_sum))
-
-max_magnitude = max(
-    map(
-        snailfish_magnitude,
-        itertools.starmap(
-            snailfish_add,
-            (
-                (list2tree(a), list2tree(b))
-                for a, b in itertools.permutations(hw_list, 2)
-            ),
-        ),
+def flat_explode(number: FlatNumber, stats: ReduceStats) -> FlatNumber:
+    # Exploding only adds to regular numbers, which never nests a pair any
+    # deeper, so a single pass from left to right explodes them all.
+    values: list[int] = []
+    depths: list[int] = []
+    carry = 0
+    i = 0
+    while i < len(number[0]):
+        stats.visited += 1
+        val = number[0][i] + carry
+        depth = number[1][i]
+        if depth > EXPLODE_DEPTH:
+            # XXX: Numbers are only ever nested one pair too deep, so this is a
+            # pair of regular numbers.
+            if values:
+                values[-1] += val
+            carry = number[0][i + 1]
+            values.append(0)
+            depths.append(depth - 1)
+            i += 2
+        else:
+            carry = 0
+            values.append(val)
+            depths.append(depth)
+            i += 1
+    return values, depths
+
+
+def flat_split(number: FlatNumber, stats: ReduceStats) -> None:
+    # Every regular number left of the current one is less than the split
+    # threshold, so after each action resume from the leftmost regular number
+    # that it could have changed rather than from the start.
+    values, depths = number
+    i = 0
+    while i < len(values):
+        stats.visited += 1
+        val = values[i]
+        if val < SPLIT_THRESHOLD:
+            i += 1
+            continue
+
+        depth = depths[i] + 1
+        if depth <= EXPLODE_DEPTH:
+            values[i : i + 1] = [val // 2, val - val // 2]
+            depths[i : i + 1] = [depth, depth]
+            continue
+
+        # The split nests a pair too deep, which explodes right away and only
+        # changes its neighbors.
+        if i > 0:
+            values[i - 1] += val // 2
+        if i + 1 < len(values):
+            values[i + 1] += val - val // 2
+        values[i] = 0
+        i = max(i - 1, 0)
+
+
+def flat_add(
+    lhs: FlatNumber, rhs: FlatNumber, stats: ReduceStats | None = None
+) -> FlatNumber:
+    # The operands are left untouched, so they can be added again.
+    if stats is None:
+        stats = ReduceStats()
+    stats.additions += 1
+    number = flat_explode(
+        (lhs[0] + rhs[0], [depth + 1 for depth in lhs[1] + rhs[1]]), stats
     )
-)
+    flat_split(number, stats)
+    return number
+
+
+def flat_magnitude(number: FlatNumber) -> int:
+    # Combine adjacent regular numbers as soon as they make up a pair.
+    stack: list[tuple[int, int]] = []
+    for val, depth in zip(*number, strict=True):
+        while stack and stack[-1][1] == depth:
+            left, _ = stack.pop()
+            val = left * 3 + val * 2
+            depth -= 1
+        stack.append((val, depth))
+    ((magnitude, _),) = stack
+    return magnitude
+
+
+def pack_flat(number: FlatNumber) -> bytes:
+    # XXX: Reduced numbers have regular numbers less than SPLIT_THRESHOLD
+    # nested at most EXPLODE_DEPTH deep, so each fits in a byte.
+    return bytes(val << 3 | depth for val, depth in zip(*number, strict=True))
+
+
+def unpack_flat(packed: bytes) -> FlatNumber:
+    return [b >> 3 for b in packed], [b & 0b111 for b in packed]
+
+
+def max_magnitude_bound(value_sum: int) -> int:
+    # Exploding and splitting never add to the sum of the regular numbers, and
+    # any place in a reduced number is worth at most one of MAGNITUDE_WEIGHTS,
+    # so the most a reduced number can be worth is this sum poured into the
+    # most valuable places.
+    bound = 0
+    for weight in MAGNITUDE_WEIGHTS:
+        val = min(value_sum, SPLIT_THRESHOLD - 1)
+        bound += val * weight
+        value_sum -= val
+    return bound
+
+
+_worker_numbers: list[FlatNumber] = []
+
+
+def init_pair_worker(packed_numbers: list[bytes]) -> None:
+    _worker_numbers[:] = map(unpack_flat, packed_numbers)
+
+
+def max_pair_magnitude_task(
+    pairs: list[tuple[int, int]], best: int
+) -> tuple[int, ReduceStats]:
+    stats = ReduceStats()
+    for i, j in pairs:
+        lhs = _worker_numbers[i]
+        rhs = _worker_numbers[j]
+        if max_magnitude_bound(sum(lhs[0]) + sum(rhs[0])) > best:
+            best = max(best, flat_magnitude(flat_add(lhs, rhs, stats)))
+    return best, stats
+
+
+def pairs_by_bound(numbers: list[FlatNumber]) -> Iterator[tuple[int, int]]:
+    # Ordered pairs of distinct numbers, from the highest magnitude bound to
+    # the lowest.
+    by_sum = defaultdict(list)
+    for i, (values, _) in enumerate(numbers):
+        by_sum[sum(values)].append(i)
+    for total in sorted({a + b for a in by_sum for b in by_sum}, reverse=True):
+        for lhs_sum, lhs_indices in by_sum.items():
+            rhs_indices = by_sum.get(total - lhs_sum, [])
+            for i in lhs_indices:
+                for j in rhs_indices:
+                    if i != j:
+                        yield i, j
+
+
+def max_pair_magnitude(
+    numbers: list[FlatNumber], stats: ReduceStats, workers: int | None = None
+) -> int:
+    in_flight = 2 * (workers or os.cpu_count() or 1)
+    pairs = pairs_by_bound(numbers)
+    best = 0
+    pending: set[Future[tuple[int, ReduceStats]]] = set()
+
+    def collect(futures: set[Future[tuple[int, ReduceStats]]]) -> None:
+        nonlocal best
+        for future in futures:
+            task_best, task_stats = future.result()
+            best = max(best, task_best)
+            stats.additions += task_stats.additions
+            stats.visited += task_stats.visited
+
+    # XXX: The pair task and its initializer only exist once this script has
+    # run, and it has no __main__ guard to stop a spawned worker from adding
+    # up the homework all over again.  So the pool forks, which rules out
+    # platforms without the fork start method.
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=init_pair_worker,
+        initargs=([pack_flat(number) for number in numbers],),
+    ) as executor:
+        while chunk := list(itertools.islice(pairs, PAIRS_PER_TASK)):
+            if len(pending) >= in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            i, j = chunk[0]
+            if max_magnitude_bound(sum(numbers[i][0]) + sum(numbers[j][0])) <= best:
+                # No remaining pair can do better.
+                break
+            pending.add(executor.submit(max_pair_magnitude_task, chunk, best))
+        collect(pending)
+
+    return best
+
+
+sum_stats = ReduceStats()
+max_stats = ReduceStats()
+if args.engine == "flat":
+    numbers = list(map(parse_flat, hw_lines))
+    snail_sum_flat = functools.reduce(
+        functools.partial(flat_add, stats=sum_stats), numbers
+    )
+    sum_magnitude = flat_magnitude(snail_sum_flat)
+    max_magnitude = max_pair_magnitude(numbers, max_stats, args.workers)
+else:
+    hw_list = [eval(line) for line in hw_lines]
+    snail_sum = functools.reduce(
+        functools.partial(snailfish_add, stats=sum_stats), map(list2tree, hw_list)
+    )
+    sum_magnitude = snailfish_magnitude(snail_sum)
+    max_magnitude = max(
+        snailfish_magnitude(snailfish_add(list2tree(a), list2tree(b), max_stats))
+        for a, b in itertools.permutations(hw_list, 2)
+    )
+
+
+def report(stats: ReduceStats) -> None:
+    if args.stats:
+        print(
+            f"Nodes visited per addition: {stats.visited / stats.additions:.1f}",
+            f"({stats.additions} additions)",
+        )
+
+
+report(sum_stats)
+print("Part 1:", sum_magnitude)
+report(max_stats)
 print("Part 2:", max_magnitude)
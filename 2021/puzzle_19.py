@@ -1,15 +1,28 @@
+import argparse
 from collections import Counter
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 import fileinput
 from itertools import combinations
 import math
+import multiprocessing
 from operator import add
 from typing import cast
 from typing import Generator
 
+try:
+    import numpy as np
+
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
 # Constants
 COMMON_BEACON_THRESHOLD = 12
+# Overlapping scanners share the distances between each pair of common beacons.
+COMMON_DISTANCE_THRESHOLD = math.comb(COMMON_BEACON_THRESHOLD, 2)
+ALIGNMENTS_PER_TASK = 16
 
 # Types
 Coordinate = tuple[int, int, int]
@@ -49,6 +62,19 @@ UNIQUE_ORIENTATIONS = 24
 ORIENTATIONS = list(orientations((1, 2, 3)))
 assert len(ORIENTATIONS) == UNIQUE_ORIENTATIONS
 
+# An orientation and then a translation.
+Transform = tuple[Coordinate, Coordinate]
+IDENTITY: Transform = ((1, 2, 3), (0, 0, 0))
+assert IDENTITY[0] in ORIENTATIONS
+
+if HAVE_NUMPY:
+    # Each orientation as a rotation matrix, e.g., (-2, 1, 3) maps (x, y, z) to
+    # (-y, x, z).
+    ROTATIONS = np.zeros((UNIQUE_ORIENTATIONS, 3, 3), dtype=np.int64)
+    for i, o in enumerate(ORIENTATIONS):
+        for row, axis in enumerate(o):
+            ROTATIONS[i, row, abs(axis) - 1] = int(math.copysign(1, axis))
+
 
 # Functions
 def manhattan_distance(p1: Coordinate, p2: Coordinate) -> int:
@@ -62,29 +88,123 @@ def apply_orientation(c: Coordinate, orientation: tuple[int, int, int]) -> Coord
     )
 
 
-def align_scanner(scanner: Scanner, beacons: set[Coordinate]) -> bool:
+def squared_distance(p1: Coordinate, p2: Coordinate) -> int:
+    return sum(map(lambda a, b: (a - b) ** 2, p1, p2))
+
+
+def fingerprint(beacons: set[Coordinate]) -> Counter[int]:
+    # Distances between beacons don't depend on the scanner's orientation or
+    # position.
+    return Counter(squared_distance(a, b) for a, b in combinations(beacons, 2))
+
+
+def transform(c: Coordinate, t: Transform) -> Coordinate:
+    orientation, translation = t
+    return cast(
+        Coordinate, tuple(map(add, apply_orientation(c, orientation), translation))
+    )
+
+
+def compose(inner: Transform, outer: Transform) -> Transform:
+    # Transforming by the result is the same as by inner and then by outer.
+    inner_orientation, inner_translation = inner
+    outer_orientation, _ = outer
+    return (
+        apply_orientation(inner_orientation, outer_orientation),
+        transform(inner_translation, outer),
+    )
+
+
+def invert(t: Transform) -> Transform:
+    orientation, translation = t
+    inverse = next(
+        o for o in ORIENTATIONS if apply_orientation(orientation, o) == IDENTITY[0]
+    )
+    return (
+        inverse,
+        cast(Coordinate, tuple(-x for x in apply_orientation(translation, inverse))),
+    )
+
+
+def find_alignment(
+    beacons: set[Coordinate], known_beacons: set[Coordinate]
+) -> Transform | None:
+    # Find the transform from the beacons' frame into the known beacons'.
     for o in ORIENTATIONS:
-        reoriented_beacons = [apply_orientation(b, o) for b in scanner.beacons]
+        reoriented_beacons = [apply_orientation(b, o) for b in beacons]
         deltas = Counter(
             (x2 - x1, y2 - y1, z2 - z1)
             for x1, y1, z1 in reoriented_beacons
-            for x2, y2, z2 in beacons
+            for x2, y2, z2 in known_beacons
         )
         translation, count = deltas.most_common(1)[0]
         if count >= COMMON_BEACON_THRESHOLD:
-            scanner.position = translation
-            scanner.beacons = set(
-                cast(Coordinate, tuple(map(add, b, translation)))
-                for b in reoriented_beacons
-            )
-            return True
+            return (o, translation)
+
+    return None
 
-    return False
+
+def numpy_find_alignment(
+    beacons: set[Coordinate], known_beacons: set[Coordinate]
+) -> Transform | None:
+    scanner_beacons = np.array(list(beacons), dtype=np.int64)
+    others = np.array(list(known_beacons), dtype=np.int64)
+
+    # (orientation, beacon, axis)
+    reoriented_beacons = np.einsum("oij,nj->oni", ROTATIONS, scanner_beacons)
+    # (orientation, beacon, known beacon, axis)
+    deltas = others[None, None, :, :] - reoriented_beacons[:, :, None, :]
+
+    # Pack each orientation and delta into one integer to count them all at
+    # once.
+    base = 2 * int(np.abs(deltas).max()) + 1
+    keys = (deltas + base // 2) @ np.array([base**2, base, 1], dtype=np.int64)
+    keys += np.arange(UNIQUE_ORIENTATIONS, dtype=np.int64)[:, None, None] * base**3
+    unique_keys, counts = np.unique(keys, return_counts=True)
+
+    best = int(counts.argmax())
+    if counts[best] < COMMON_BEACON_THRESHOLD:
+        return None
+
+    o, key = divmod(int(unique_keys[best]), base**3)
+    translation = cast(
+        Coordinate,
+        tuple((key // base**i) % base - base // 2 for i in reversed(range(3))),
+    )
+    return (ORIENTATIONS[o], translation)
 
 
 # Parse
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--stats",
+    action="store_true",
+    help="report the alignment attempts skipped by fingerprinting",
+)
+parser.add_argument(
+    "--backend",
+    choices=("python", "numpy"),
+    default="numpy" if HAVE_NUMPY else "python",
+    help="scanner alignment implementation",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="number of forked processes aligning scanners (default: number of CPUs)",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+if args.workers is not None and args.workers < 1:
+    parser.error(f"workers {args.workers} is not a positive number")
+if args.backend == "numpy" and not HAVE_NUMPY:
+    parser.error("the numpy backend requires numpy")
+align = numpy_find_alignment if args.backend == "numpy" else find_alignment
+
 report: list[set[Coordinate]] = []
-for line in filter(lambda x: x, (line.rstrip() for line in fileinput.input())):
+for line in filter(
+    lambda x: x, (line.rstrip() for line in fileinput.input(args.files))
+):
     if "scanner" in line:
         report.append(set())
     else:
@@ -93,21 +213,64 @@ for line in filter(lambda x: x, (line.rstrip() for line in fileinput.input())):
 
 # Init
 scanners = [Scanner(i, beacons) for i, beacons in enumerate(report)]
-unidentified_scanners = deque(scanners)
 
-scanner = unidentified_scanners.popleft()
-assert scanner.id == 0
-scanner.position = (0, 0, 0)
+# Count the distances each pair of scanners share through the scanners each
+# distance is seen by, which avoids comparing every pair of scanners.
+fingerprint_scanners: dict[int, list[tuple[int, int]]] = {}
+for s in scanners:
+    for distance, count in fingerprint(s.beacons).items():
+        fingerprint_scanners.setdefault(distance, []).append((s.id, count))
+
+shared_distances: Counter[tuple[int, int]] = Counter()
+for seen_by in fingerprint_scanners.values():
+    for (a, a_count), (b, b_count) in combinations(seen_by, 2):
+        shared_distances[a, b] += min(a_count, b_count)
 
-beacons = set(scanner.beacons)
+candidate_pairs = [
+    pair
+    for pair, count in shared_distances.items()
+    if count >= COMMON_DISTANCE_THRESHOLD
+]
 
 # Main
-while unidentified_scanners:
-    scanner = unidentified_scanners.popleft()
-    if align_scanner(scanner, beacons):
-        beacons |= scanner.beacons
-    else:
-        unidentified_scanners.append(scanner)
+# XXX: align() is defined in this unguarded script, and a spawned worker would
+# have to import it, parsing the input and reaching this pool again.  Forked
+# workers start with it already defined, so aligning needs a platform with the
+# fork start method.
+with ProcessPoolExecutor(
+    args.workers, mp_context=multiprocessing.get_context("fork")
+) as executor:
+    alignments = executor.map(
+        align,
+        (scanners[b].beacons for _, b in candidate_pairs),
+        (scanners[a].beacons for a, _ in candidate_pairs),
+        chunksize=ALIGNMENTS_PER_TASK,
+    )
+
+    # Transforms from each scanner's frame into an overlapping scanner's.
+    overlaps: list[dict[int, Transform]] = [{} for _ in scanners]
+    for (a, b), alignment in zip(candidate_pairs, alignments, strict=True):
+        if alignment is not None:
+            overlaps[a][b] = alignment
+            overlaps[b][a] = invert(alignment)
+
+# Place scanners outward from scanner 0, each by way of the neighbor it was
+# reached from.
+transforms = {0: IDENTITY}
+unplaced_neighbors = deque([0])
+while unplaced_neighbors:
+    a = unplaced_neighbors.popleft()
+    for b, alignment in overlaps[a].items():
+        if b not in transforms:
+            transforms[b] = compose(alignment, transforms[a])
+            unplaced_neighbors.append(b)
+assert len(transforms) == len(scanners), "Some scanners don't overlap!"
+
+beacons: set[Coordinate] = set()
+for s in scanners:
+    s.position = transforms[s.id][1]
+    s.beacons = set(transform(b, transforms[s.id]) for b in s.beacons)
+    beacons |= s.beacons
 
 print("Part 1:", len(beacons))
 
@@ -118,3 +281,11 @@ print(
         for a, b in combinations((s.position for s in scanners), 2)
     ),
 )
+
+if args.stats:
+    print(
+        "Alignment attempts:",
+        len(candidate_pairs),
+        f"(skipped {math.comb(len(scanners), 2) - len(candidate_pairs)}"
+        " by fingerprint)",
+    )
@@ -1,11 +1,24 @@
+import argparse
 from collections import deque
 from copy import deepcopy
+from dataclasses import dataclass
 from enum import Enum
 import fileinput
+from itertools import islice
 from itertools import repeat
+import random
+import time
 from typing import Generator
 from typing import Sequence
 
+try:
+    import numpy as np
+    import numpy.typing as npt
+
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
 # Types
 Coordinate = tuple[int, int]
 
@@ -22,9 +35,12 @@ STEPS = (
 )
 
 PIXEL2BINARY = str.maketrans(f"{PixelType.DARK.value}{PixelType.LIGHT.value}", "01")
+BINARY2PIXEL = str.maketrans("01", f"{PixelType.DARK.value}{PixelType.LIGHT.value}")
 
 ALGORITHM_LENGTH = 512
 
+BLOCK_BITS = 16
+
 
 # Functions
 def submatrix_coordinates(row: int, col: int) -> Generator[Coordinate, None, None]:
@@ -75,8 +91,111 @@ def _enhance(
     return result
 
 
+def block_table(algorithm: Sequence[str]) -> list[int]:
+    # Map each 4x4 block of pixels, as 16 bits from the top left, to the 2x2
+    # pixels enhanced at its center, as 4 bits from the top left.  The top
+    # pair only depends on the top three rows and the bottom pair on the
+    # bottom three.
+    lit = [p == PixelType.LIGHT.value for p in algorithm]
+    row_table = [
+        lit[(a >> 1) << 6 | (b >> 1) << 3 | c >> 1] << 1
+        | lit[(a & 0b111) << 6 | (b & 0b111) << 3 | c & 0b111]
+        for a in range(16)
+        for b in range(16)
+        for c in range(16)
+    ]
+    return [
+        row_table[block >> 4] << 2 | row_table[block & 0xFFF]
+        for block in range(1 << BLOCK_BITS)
+    ]
+
+
+def _table_enhance(
+    image: list[int],
+    width: int,
+    table: Sequence[int],
+    infinite_pixel: PixelType,
+) -> tuple[list[int], int]:
+    # Rows are bits from the left.  Enhance 2x2 pixels at a time, padding the
+    # image to whole blocks and trimming any extra row or column afterwards.
+    rows = len(image) + 2
+    cols = width + 2
+    padded_width = cols + cols % 2 + 2
+    fill = (1 << padded_width) - 1 if infinite_pixel == PixelType.LIGHT else 0
+    right = padded_width - 2 - width
+    image_mask = ((1 << width) - 1) << right
+    padded = (
+        [fill] * 2
+        + [fill & ~image_mask | row << right for row in image]
+        + [fill] * (2 + rows % 2)
+    )
+
+    result = []
+    for r in range(0, rows, 2):
+        r0, r1, r2, r3 = padded[r : r + 4]
+        top = 0
+        bottom = 0
+        for shift in range(padded_width - 4, -1, -2):
+            block = table[
+                (r0 >> shift & 0xF) << 12
+                | (r1 >> shift & 0xF) << 8
+                | (r2 >> shift & 0xF) << 4
+                | r3 >> shift & 0xF
+            ]
+            top = top << 2 | block >> 2
+            bottom = bottom << 2 | block & 0b11
+        result.append(top)
+        result.append(bottom)
+
+    if rows % 2:
+        result.pop()
+    if cols % 2:
+        result = [row >> 1 for row in result]
+    return result, cols
+
+
 # Parse
-stdin = fileinput.input()
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--engine",
+    choices=("python", "table", "numpy"),
+    default="numpy" if HAVE_NUMPY else "table",
+    help="image enhancement implementation",
+)
+parser.add_argument(
+    "--step",
+    type=int,
+    action="append",
+    help="report the lit pixels after STEP steps",
+)
+parser.add_argument(
+    "--resume",
+    metavar="CHECKPOINT",
+    help="continue enhancing from a checkpoint",
+)
+parser.add_argument(
+    "--checkpoint",
+    metavar="CHECKPOINT",
+    help="save the enhancement after the last step",
+)
+parser.add_argument(
+    "--benchmark",
+    action="store_true",
+    help="time each engine through the steps on the image and a random one",
+)
+parser.add_argument(
+    "--benchmark-size",
+    type=int,
+    default=500,
+    metavar="SIZE",
+    help="size of the random image to benchmark (default: %(default)s)",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+if args.engine == "numpy" and not HAVE_NUMPY:
+    parser.error("the numpy engine requires numpy")
+
+stdin = fileinput.input(args.files)
 input_algo = tuple(stdin.readline().rstrip())
 assert len(input_algo) == ALGORITHM_LENGTH
 stdin.readline()
@@ -84,29 +203,183 @@ input_image = list(list(line.rstrip()) for line in stdin)
 
 
 # Main
-def enhance(
-    image: Sequence[Sequence[str]],
-    algorithm: Sequence[str],
-    steps: int = 1,
-) -> Sequence[Sequence[str]]:
-    img = deque(deque(col) for col in image)
-    infinite_pixel = PixelType.DARK
-    alternate_pixel = (
-        algorithm[0] == PixelType.LIGHT.value and algorithm[-1] == PixelType.DARK.value
+def count_pixels(image: Sequence[Sequence[str]], pixel: PixelType) -> int:
+    return sum(col.count(pixel.value) for col in image)
+
+
+def next_infinite_pixel(algorithm: Sequence[str], pixel: PixelType) -> PixelType:
+    # Every pixel in the infinite image shares the same submatrix.
+    return PixelType(algorithm[0 if pixel == PixelType.DARK else -1])
+
+
+def _numpy_enhance(
+    image: "npt.NDArray[np.uint8]",
+    algorithm: "npt.NDArray[np.uint8]",
+    infinite_pixel: PixelType,
+) -> "npt.NDArray[np.uint8]":
+    # Pad by two since the image grows by one on each side and pixels on the
+    # new edge see one more beyond it.
+    padded = np.pad(image, 2, constant_values=infinite_pixel == PixelType.LIGHT).astype(
+        np.uint16
     )
-    for _ in range(steps):
-        img = _enhance(img, algorithm, infinite_pixel)
-        if alternate_pixel:
-            infinite_pixel = (
-                PixelType.LIGHT if infinite_pixel == PixelType.DARK else PixelType.DARK
+    # Weigh each row of the 3x3 submatrix and then the rows together.
+    rows = (padded[:, :-2] << 2) | (padded[:, 1:-1] << 1) | padded[:, 2:]
+    result: npt.NDArray[np.uint8] = algorithm[
+        (rows[:-2] << 6) | (rows[1:-1] << 3) | rows[2:]
+    ]
+    return result
+
+
+@dataclass
+class Checkpoint:
+    step: int
+    infinite_pixel: PixelType
+    image: list[str]
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            print(self.step, self.infinite_pixel.value, file=f)
+            for row in self.image:
+                print(row, file=f)
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with open(path) as f:
+            step, infinite_pixel = f.readline().split()
+            return cls(
+                int(step), PixelType(infinite_pixel), [line.rstrip() for line in f]
             )
-    return img
 
 
-def count_pixels(image: Sequence[Sequence[str]], pixel: PixelType) -> int:
-    return sum(col.count(pixel.value) for col in image)
+class Enhancement:
+    """An image enhanced one step at a time.
+
+    Iterating enhances the image indefinitely, yielding each step and the
+    number of lit pixels after it.  The enhancement can be checkpointed
+    between steps and resumed later.
+    """
+
+    # PUBLIC DATA
+    algorithm: Sequence[str]
+    engine: str
+    step: int
+    infinite_pixel: PixelType
 
+    # DATA
+    _image: "deque[deque[str]] | list[int] | npt.NDArray[np.uint8]"
+    _width: int
 
-for i, step in enumerate(STEPS):
-    lit_pixels = count_pixels(enhance(input_image, input_algo, step), PixelType.LIGHT)
-    print(f"Part {i + 1}:", lit_pixels)
+    # CREATORS
+    def __init__(self, checkpoint: Checkpoint, algorithm: Sequence[str], engine: str):
+        self.algorithm = algorithm
+        self.engine = engine
+        self.step = checkpoint.step
+        self.infinite_pixel = checkpoint.infinite_pixel
+        self._width = len(checkpoint.image[0])
+        if engine == "table":
+            self._image = [
+                int(row.translate(PIXEL2BINARY), 2) for row in checkpoint.image
+            ]
+        elif engine == "numpy":
+            self._image = np.array(
+                [[p == PixelType.LIGHT.value for p in row] for row in checkpoint.image],
+                dtype=np.uint8,
+            )
+        else:
+            self._image = deque(deque(row) for row in checkpoint.image)
+
+    # MANIPULATORS
+    def __iter__(self) -> Generator[tuple[int, int], None, None]:
+        if isinstance(self._image, deque):
+            image = self._image
+            while True:
+                image = _enhance(image, self.algorithm, self.infinite_pixel)
+                self._advance(image)
+                yield self.step, count_pixels(image, PixelType.LIGHT)
+        elif isinstance(self._image, list):
+            bit_image = self._image
+            table = block_table(self.algorithm)
+            while True:
+                bit_image, self._width = _table_enhance(
+                    bit_image, self._width, table, self.infinite_pixel
+                )
+                self._advance(bit_image)
+                yield self.step, sum(row.bit_count() for row in bit_image)
+        else:
+            np_image = self._image
+            np_algorithm = np.array(
+                [p == PixelType.LIGHT.value for p in self.algorithm], dtype=np.uint8
+            )
+            while True:
+                np_image = _numpy_enhance(np_image, np_algorithm, self.infinite_pixel)
+                self._advance(np_image)
+                yield self.step, int(np_image.sum())
+
+    def _advance(
+        self, image: "deque[deque[str]] | list[int] | npt.NDArray[np.uint8]"
+    ) -> None:
+        self._image = image
+        self.step += 1
+        self.infinite_pixel = next_infinite_pixel(self.algorithm, self.infinite_pixel)
+
+    # ACCESSORS
+    def checkpoint(self) -> Checkpoint:
+        if isinstance(self._image, deque):
+            image = ["".join(row) for row in self._image]
+        elif isinstance(self._image, list):
+            image = [
+                format(row, f"0{self._width}b").translate(BINARY2PIXEL)
+                for row in self._image
+            ]
+        else:
+            image = [
+                "".join(
+                    PixelType.LIGHT.value if p else PixelType.DARK.value for p in row
+                )
+                for row in self._image.tolist()
+            ]
+        return Checkpoint(self.step, self.infinite_pixel, image)
+
+
+if args.resume:
+    checkpoint = Checkpoint.load(args.resume)
+else:
+    checkpoint = Checkpoint(0, PixelType.DARK, ["".join(row) for row in input_image])
+
+steps = STEPS if args.step is None else tuple(args.step)
+if any(step <= checkpoint.step for step in steps):
+    parser.error(f"steps must be after the checkpoint's step ({checkpoint.step})")
+
+enhancement = Enhancement(checkpoint, input_algo, args.engine)
+lit_pixels = dict(islice(enhancement, max(steps) - checkpoint.step))
+for i, step in enumerate(steps):
+    if args.step is None:
+        print(f"Part {i + 1}:", lit_pixels[step])
+    else:
+        print(f"Step {step}:", lit_pixels[step])
+
+if args.checkpoint:
+    enhancement.checkpoint().save(args.checkpoint)
+
+if args.benchmark:
+    random.seed(args.benchmark_size)
+    pixels = [p.value for p in PixelType]
+    random_image = [
+        "".join(random.choices(pixels, k=args.benchmark_size))
+        for _ in range(args.benchmark_size)
+    ]
+    engines = ["python", "table"] + (["numpy"] if HAVE_NUMPY else [])
+    for name, image in (
+        ("input", checkpoint.image),
+        (f"{args.benchmark_size}x{args.benchmark_size}", random_image),
+    ):
+        for engine in engines:
+            start = time.perf_counter()
+            benchmark = Enhancement(
+                Checkpoint(checkpoint.step, checkpoint.infinite_pixel, image),
+                input_algo,
+                engine,
+            )
+            deque(islice(benchmark, max(steps) - checkpoint.step), maxlen=0)
+            elapsed = time.perf_counter() - start
+            print(f"Benchmark {name} ({engine}):", f"{elapsed:.3f}s")
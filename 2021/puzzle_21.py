@@ -1,9 +1,12 @@
+import argparse
+from collections import Counter
 import dataclasses
 from dataclasses import dataclass
 import fileinput
 import functools
 from itertools import cycle
 from itertools import product
+from typing import Callable
 
 
 # Types
@@ -19,7 +22,39 @@ def move_forward(start: int, steps: int) -> int:
 
 
 # Parse
-start_positions = tuple(int(line.split(":")[-1].strip()) for line in fileinput.input())
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--simulator",
+    choices=("cycle", "step"),
+    default="cycle",
+    help="deterministic dice game implementation",
+)
+parser.add_argument(
+    "--practice-goal",
+    type=int,
+    action="append",
+    default=[],
+    help="also play the deterministic dice game to PRACTICE_GOAL points",
+)
+parser.add_argument(
+    "--solver",
+    choices=("table", "memo"),
+    default="table",
+    help="Dirac dice win counting implementation",
+)
+parser.add_argument(
+    "--goal",
+    type=int,
+    action="append",
+    default=[],
+    help="also count the Dirac dice wins when playing to GOAL points",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+
+start_positions = tuple(
+    int(line.split(":")[-1].strip()) for line in fileinput.input(args.files)
+)
 
 
 # Main
@@ -44,6 +79,56 @@ def practice_game(
                 return (tuple(p.score for p in players), roll_count)
 
 
+def cycle_practice_game(
+    p1_start: int,
+    p2_start: int,
+    goal: int = 1000,
+    *,
+    board_size: int = 10,
+    die_sides: int = 100,
+    rolls: int = 3,
+) -> tuple[tuple[int, ...], int]:
+    positions = [p1_start, p2_start]
+    scores = [0, 0]
+    die = 0
+    roll_count = 0
+
+    # The die and positions wrap around, so the game repeats the same turns
+    # from some point on, each time adding the same points and rolls.  Skip
+    # over as many of those cycles as possible without anybody winning.
+    seen: dict[tuple[int, ...], tuple[list[int], int]] | None = {}
+    turn = 0
+    while True:
+        if seen is not None:
+            state = (die, turn, *positions)
+            if state in seen:
+                cycle_scores, cycle_roll_count = seen[state]
+                cycle_points = [
+                    a - b for a, b in zip(scores, cycle_scores, strict=True)
+                ]
+                cycles = min(
+                    (goal - 1 - score) // points
+                    for score, points in zip(scores, cycle_points, strict=True)
+                )
+                scores = [
+                    score + cycles * points
+                    for score, points in zip(scores, cycle_points, strict=True)
+                ]
+                roll_count += cycles * (roll_count - cycle_roll_count)
+                seen = None
+            else:
+                seen[state] = (scores[:], roll_count)
+
+        roll_sum = sum((die + i) % die_sides + 1 for i in range(rolls))
+        die = (die + rolls) % die_sides
+        roll_count += rolls
+        positions[turn] = 1 + (positions[turn] + roll_sum - 1) % board_size
+        scores[turn] += positions[turn]
+        if scores[turn] >= goal:
+            return (tuple(scores), roll_count)
+        turn = 1 - turn
+
+
 def real_game(
     p1_start: int,
     p2_start: int,
@@ -72,8 +157,87 @@ def real_game(
     return count_wins(*players)
 
 
-scores, roll_count = practice_game(*start_positions)
+def player_outcomes(
+    start: int, goal: int, board_size: int, roll_sums: Counter[int]
+) -> tuple[list[int], list[int]]:
+    # Universes where a player reaches the goal on each of their turns, and
+    # universes where they are still playing after each of their turns.
+    wins = [0]
+    playing = [1]
+    # Universes by position (from 0) and score before reaching the goal.
+    universes = [[0] * goal for _ in range(board_size)]
+    universes[start - 1][0] = 1
+    while playing[-1]:
+        turn_wins = 0
+        turn_universes = [[0] * goal for _ in range(board_size)]
+        for position, scores in enumerate(universes):
+            for score, count in enumerate(scores):
+                if not count:
+                    continue
+                for roll_sum, rolls in roll_sums.items():
+                    new_position = (position + roll_sum) % board_size
+                    new_score = score + new_position + 1
+                    if new_score >= goal:
+                        turn_wins += count * rolls
+                    else:
+                        turn_universes[new_position][new_score] += count * rolls
+        universes = turn_universes
+        wins.append(turn_wins)
+        playing.append(sum(map(sum, universes)))
+    return wins, playing
+
+
+def table_real_game(
+    p1_start: int,
+    p2_start: int,
+    goal: int = 21,
+    *,
+    board_size: int = 10,
+    die_sides: int = 3,
+    rolls: int = 3,
+) -> tuple[int, ...]:
+    # Only the sum of each turn's rolls matters, e.g., three rolls of a
+    # three-sided die add up to 3..9 in 1, 3, 6, 7, 6, 3, 1 ways.
+    roll_sums = Counter(map(sum, product(range(1, die_sides + 1), repeat=rolls)))
+
+    # Players don't affect each other's position or score, so count the
+    # outcomes of each player's turns on their own.  Player 1 wins on their
+    # turn if player 2 is still playing after one fewer turn; player 2 wins on
+    # their turn if player 1 is still playing after as many turns.
+    p1_wins, p1_playing = player_outcomes(p1_start, goal, board_size, roll_sums)
+    p2_wins, p2_playing = player_outcomes(p2_start, goal, board_size, roll_sums)
+    return (
+        sum(
+            wins * p2_playing[turn - 1]
+            for turn, wins in enumerate(p1_wins)
+            if 0 < turn <= len(p2_playing)
+        ),
+        sum(
+            wins * p1_playing[turn]
+            for turn, wins in enumerate(p2_wins)
+            if turn < len(p1_playing)
+        ),
+    )
+
+
+PRACTICE_GAMES: dict[str, Callable[..., tuple[tuple[int, ...], int]]] = {
+    "cycle": cycle_practice_game,
+    "step": practice_game,
+}
+REAL_GAMES: dict[str, Callable[..., tuple[int, ...]]] = {
+    "table": table_real_game,
+    "memo": real_game,
+}
+
+scores, roll_count = PRACTICE_GAMES[args.simulator](*start_positions)
 print("Part 1:", min(scores) * roll_count)
 
-wins = real_game(*start_positions)
+wins = REAL_GAMES[args.solver](*start_positions)
 print("Part 2:", max(wins))
+
+for goal in args.practice_goal:
+    scores, roll_count = PRACTICE_GAMES[args.simulator](*start_positions, goal)
+    print(f"Practice goal {goal}:", min(scores) * roll_count)
+
+for goal in args.goal:
+    print(f"Goal {goal}:", max(REAL_GAMES[args.solver](*start_positions, goal)))
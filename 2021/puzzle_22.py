@@ -1,6 +1,12 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import IntEnum
 import fileinput
+from itertools import chain
+from itertools import pairwise
+import multiprocessing
 from typing import Sequence
 
 
@@ -10,7 +16,7 @@ class CubeState(IntEnum):
     ON = 1
 
 
-@dataclass
+@dataclass(unsafe_hash=True)
 class Cuboid:
     # XXX: Ranges are inclusive (i.e., stop + 1).
     x: range
@@ -53,41 +59,66 @@ def create_inclusive_range(start: int, end: int) -> range:
     return range(start, end + 1)
 
 
-# Parse
-reboot_steps: list[RebootStep] = []
-for line in fileinput.input():
-    input_state, input_coordinates = line.rstrip().split()
-    state = CubeState[input_state.upper()]
-    cuboid = Cuboid(
+def parse_cuboid(coordinates: str) -> Cuboid:
+    return Cuboid(
         **dict(
             map(
                 lambda c: (
                     c[0],
                     create_inclusive_range(*map(int, c[1].split(".."))),
                 ),
-                (x.split("=") for x in input_coordinates.split(",")),
+                (x.split("=") for x in coordinates.split(",")),
             )
         )
     )
-    reboot_steps.append(RebootStep(state, cuboid))
-
-reboot_steps_within_50 = [
-    s
-    for s in reboot_steps
-    if (
-        s.cuboid
-        & Cuboid(
-            create_inclusive_range(-50, 50),
-            create_inclusive_range(-50, 50),
-            create_inclusive_range(-50, 50),
-        )
-    )
-    == s.cuboid
-]
+
+
+# Parse
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--engine",
+    choices=("signed", "merged", "compressed"),
+    default="compressed",
+    help="reactor reboot implementation",
+)
+parser.add_argument(
+    "--query",
+    action="append",
+    default=[],
+    metavar="x=X0..X1,y=Y0..Y1,z=Z0..Z1",
+    help="report the cubes left on within the region after rebooting",
+)
+parser.add_argument(
+    "--partitions",
+    type=int,
+    default=1,
+    help="reboot this many disjoint slabs of the reactor in parallel (needs fork)",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="number of processes rebooting slabs (default: number of CPUs)",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+if args.partitions < 1:
+    parser.error(f"partitions {args.partitions} is not a positive number")
+if args.workers is not None and args.workers < 1:
+    parser.error(f"workers {args.workers} is not a positive number")
+
+reboot_steps: list[RebootStep] = []
+for line in fileinput.input(args.files):
+    input_state, input_coordinates = line.rstrip().split()
+    state = CubeState[input_state.upper()]
+    reboot_steps.append(RebootStep(state, parse_cuboid(input_coordinates)))
+
+# Init
+INITIALIZATION_REGION = parse_cuboid("x=-50..50,y=-50..50,z=-50..50")
 
 
 # Main
-def reboot_reactor(reboot_sequence: Sequence[RebootStep]) -> int:
+def reboot_reactor(reboot_sequence: Sequence[RebootStep]) -> list[StatefulCuboid]:
     cubes: list[StatefulCuboid] = []
 
     for step in reboot_sequence:
@@ -99,11 +130,231 @@ def reboot_reactor(reboot_sequence: Sequence[RebootStep]) -> int:
         if step.state == CubeState.ON:
             cubes.append(cube)
 
-    return sum(c.volume for c in cubes)
+    return cubes
 
 
-lit_count = reboot_reactor(reboot_steps_within_50)
+def merged_reboot_reactor(
+    reboot_sequence: Sequence[RebootStep],
+) -> list[StatefulCuboid]:
+    # Signed cuboids are keyed by extent, so equal cuboids merge into one entry
+    # and entries whose signs cancel out are dropped.
+    cubes: Counter[Cuboid] = Counter()
+
+    for step in reboot_sequence:
+        update: Counter[Cuboid] = Counter()
+        for cuboid, sign in cubes.items():
+            intersection = step.cuboid & cuboid
+            if intersection.cubes != 0:
+                update[intersection] -= sign
+
+        if step.state == CubeState.ON:
+            update[step.cuboid] += 1
+
+        for cuboid, sign in update.items():
+            cubes[cuboid] += sign
+            if cubes[cuboid] == 0:
+                del cubes[cuboid]
+
+    return [StatefulCuboid(c, sign) for c, sign in cubes.items()]
+
+
+# (start, stop) for each axis.
+Bounds = tuple[int, ...]
+
+
+def compressed_reboot_reactor(
+    reboot_sequence: Sequence[RebootStep],
+) -> list[StatefulCuboid]:
+    # The regions left on are disjoint, so each is a positive cuboid.
+    cubes: list[StatefulCuboid] = []
+
+    # XXX: Work with plain (start, stop) bounds for each axis; creating
+    # Cuboids for every clipped step dominates the run time otherwise.
+    def lit_cubes(region: Bounds, steps: list[tuple[CubeState, Bounds]]) -> None:
+        # Steps are clipped to the region, so a step covering all of it is
+        # equal to it and hides every step before it.
+        for i in reversed(range(len(steps))):
+            state, bounds = steps[i]
+            if bounds == region:
+                if state == CubeState.OFF:
+                    i += 1
+                elif i == len(steps) - 1:
+                    x0, x1, y0, y1, z0, z1 = region
+                    cubes.append(
+                        StatefulCuboid(
+                            Cuboid(range(x0, x1), range(y0, y1), range(z0, z1)),
+                            CubeState.ON,
+                        )
+                    )
+                    return
+                steps = steps[i:]
+                break
+
+        # Cubes start off, so leading off steps don't change anything.
+        first_on = 0
+        while first_on < len(steps) and steps[first_on][0] == CubeState.OFF:
+            first_on += 1
+        steps = steps[first_on:]
+        if not steps:
+            return
+
+        # Split the region in half along the axis with the most step
+        # boundaries inside of it.
+        axis = 0
+        boundaries: list[int] = []
+        for a in range(0, len(region), 2):
+            start, stop = region[a], region[a + 1]
+            axis_boundaries = sorted(
+                {
+                    b
+                    for _, bounds in steps
+                    for b in (bounds[a], bounds[a + 1])
+                    if start < b < stop
+                }
+            )
+            if len(axis_boundaries) > len(boundaries):
+                axis, boundaries = a, axis_boundaries
+        middle = boundaries[len(boundaries) // 2]
+
+        for start, stop in ((region[axis], middle), (middle, region[axis + 1])):
+            half = region[:axis] + (start, stop) + region[axis + 2 :]
+            lit_cubes(
+                half,
+                [
+                    (
+                        (state, bounds)
+                        if start <= bounds[axis] and bounds[axis + 1] <= stop
+                        else (
+                            state,
+                            bounds[:axis]
+                            + (max(start, bounds[axis]), min(stop, bounds[axis + 1]))
+                            + bounds[axis + 2 :],
+                        )
+                    )
+                    for state, bounds in steps
+                    if bounds[axis] < stop and start < bounds[axis + 1]
+                ],
+            )
+
+    steps: list[tuple[CubeState, Bounds]] = [
+        (
+            s.state,
+            (
+                s.cuboid.x.start,
+                s.cuboid.x.stop,
+                s.cuboid.y.start,
+                s.cuboid.y.stop,
+                s.cuboid.z.start,
+                s.cuboid.z.stop,
+            ),
+        )
+        for s in reboot_sequence
+    ]
+    if not steps:
+        return cubes
+
+    region = tuple(
+        (min if a % 2 == 0 else max)(bounds[a] for _, bounds in steps)
+        for a in range(len(steps[0][1]))
+    )
+    lit_cubes(region, steps)
+    return cubes
+
+
+ENGINES = {
+    "signed": reboot_reactor,
+    "merged": merged_reboot_reactor,
+    "compressed": compressed_reboot_reactor,
+}
+
+
+def partition_reactor(
+    reboot_sequence: Sequence[RebootStep], partitions: int
+) -> list[list[RebootStep]]:
+    # Split the reactor into disjoint slabs along x, cutting at evenly spaced
+    # step boundaries so that slabs have a similar number of steps, and clip
+    # each step to the slabs it overlaps.  A cube only depends on the steps
+    # covering it, so each slab can be rebooted on its own.
+    boundaries = sorted(
+        {b for s in reboot_sequence for b in (s.cuboid.x.start, s.cuboid.x.stop)}
+    )
+    cuts = sorted(
+        {boundaries[len(boundaries) * i // partitions] for i in range(1, partitions)}
+    )
+    y = range(
+        min(s.cuboid.y.start for s in reboot_sequence),
+        max(s.cuboid.y.stop for s in reboot_sequence),
+    )
+    z = range(
+        min(s.cuboid.z.start for s in reboot_sequence),
+        max(s.cuboid.z.stop for s in reboot_sequence),
+    )
+
+    slabs = []
+    for start, stop in pairwise([boundaries[0], *cuts, boundaries[-1]]):
+        slab = Cuboid(range(start, stop), y, z)
+        slabs.append(
+            [
+                RebootStep(s.state, clipped)
+                for s in reboot_sequence
+                if (clipped := s.cuboid & slab).cubes != 0
+            ]
+        )
+    return slabs
+
+
+class ReactorState:
+    """Cubes left on after a reboot, as signed cuboids."""
+
+    # PUBLIC DATA
+    cuboids: list[StatefulCuboid]
+
+    # CREATORS
+    def __init__(
+        self,
+        reboot_sequence: Sequence[RebootStep],
+        engine: str = "compressed",
+        partitions: int = 1,
+        workers: int | None = None,
+    ):
+        if partitions <= 1 or not reboot_sequence:
+            self.cuboids = ENGINES[engine](reboot_sequence)
+            return
+
+        # XXX: This script reboots the reactor as soon as it's imported, so a
+        # spawned worker would redo the whole puzzle before it could look up
+        # an engine.  Forked workers already have ENGINES; thus, partitioning
+        # only works on platforms with the fork start method.
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            self.cuboids = list(
+                chain.from_iterable(
+                    executor.map(
+                        ENGINES[engine],
+                        partition_reactor(reboot_sequence, partitions),
+                    )
+                )
+            )
+
+    # ACCESSORS
+    @property
+    def lit(self) -> int:
+        return sum(c.volume for c in self.cuboids)
+
+    def lit_within(self, region: Cuboid) -> int:
+        return sum(c.sign * (c.cuboid & region).cubes for c in self.cuboids)
+
+
+reactor_state = ReactorState(reboot_steps, args.engine, args.partitions, args.workers)
+
+# Steps that straddle the initialization region are clipped to it rather than
+# skipped, so only the cubes outside of the region are ignored.
+lit_count = reactor_state.lit_within(INITIALIZATION_REGION)
 print("Part 1:", lit_count)
 
-lit_count = reboot_reactor(reboot_steps)
+lit_count = reactor_state.lit
 print("Part 2:", lit_count)
+
+for query in args.query:
+    print(f"Query {query}:", reactor_state.lit_within(parse_cuboid(query)))
@@ -1,11 +1,10 @@
-import bisect
+import argparse
 from collections import deque
 from dataclasses import dataclass
 from enum import StrEnum
 import fileinput
 import heapq
-from itertools import chain
-from itertools import takewhile
+import random
 import sys
 from typing import Iterable
 from typing import Iterator
@@ -59,6 +58,17 @@ class Diagram:
     hallway_locations: list[Coordinate]
     valid_hallway_locations: Iterable[Coordinate]
 
+    # Locations in packed order: the hallway from left to right, then each side
+    # room from top to bottom.  Sets of locations are bitmasks by this index.
+    locations: list[Coordinate]
+    location_index: dict[Coordinate, int]
+    side_room_masks: dict[AmphipodType, int]
+    # Hallway index above each side room.
+    side_room_doors: dict[AmphipodType, int]
+    # For each side room location, the route to each hallway location where an
+    # amphipod can stop, as its steps and the locations passed in between.
+    routes: dict[int, dict[int, tuple[int, int]]]
+
     # DATA
     _loc_to_side_room_type: dict[Coordinate, AmphipodType]
 
@@ -104,11 +114,45 @@ class Diagram:
                         # Add location if not above a side room.
                         self.valid_hallway_locations.add((x, y))
 
+        self.locations = self.hallway_locations + [
+            loc for atype in AmphipodType for loc in self.side_rooms[atype]
+        ]
+        self.location_index = {loc: i for i, loc in enumerate(self.locations)}
+        self.side_room_masks = {
+            atype: self.mask(locs) for atype, locs in self.side_rooms.items()
+        }
+        self.side_room_doors = {}
+        self.routes = {}
+        for atype, locs in self.side_rooms.items():
+            door = (locs[0][0] - 1, locs[0][1])
+            self.side_room_doors[atype] = self.location_index[door]
+            for depth, loc in enumerate(locs):
+                self.routes[self.location_index[loc]] = {
+                    self.location_index[stop]: (
+                        depth + 1 + abs(door[1] - stop[1]),
+                        self.mask(
+                            list(locs[:depth])
+                            + [
+                                hallway_loc
+                                for hallway_loc in self.hallway_locations
+                                if min(door[1], stop[1])
+                                <= hallway_loc[1]
+                                <= max(door[1], stop[1])
+                                and hallway_loc != stop
+                            ]
+                        ),
+                    )
+                    for stop in sorted(self.valid_hallway_locations)
+                }
+
     # ACCESSORS
     def tile(self, location: Coordinate) -> Tile:
         x, y = location
         return self.tiles[x][y]
 
+    def mask(self, locations: Iterable[Coordinate]) -> int:
+        return sum(1 << self.location_index[loc] for loc in locations)
+
     def hallway_type(self, location: Coordinate) -> AmphipodType:
         return self._loc_to_side_room_type[location]
 
@@ -142,6 +186,7 @@ class Board:
 
     # DATA
     _loc_lookup: dict[Coordinate, Amphipod]
+    _occupied: int
 
     # PRIVATE ACCESSORS
     def __str__(self) -> str:
@@ -158,27 +203,30 @@ class Board:
         self.diagram = diagram
         self.amphipods = amphipods
         self._loc_lookup = {a.location: a for a in amphipods}
+        self._occupied = diagram.mask(self._loc_lookup)
 
     # ACCESSORS
     def moves(self, a: Amphipod) -> Iterator[Coordinate]:
         assert a in self.amphipods
-        if self.diagram.is_hallway(a.location):
+        diagram = self.diagram
+        index = diagram.location_index[a.location]
+        if diagram.is_hallway(a.location):
             if not self.side_room_ready(a):
                 return
-            elif self.hallway_path_to_side_room_blocked(a):
-                return
 
-            yield self.side_room_available_location(a)
+            dest = self.side_room_available_location(a)
+            _, between = diagram.routes[diagram.location_index[dest]][index]
+            if not self._occupied & between:
+                yield dest
         else:
             # Otherwise, the amphipod is in the side room.
-            assert self.diagram.is_side_room(a.location)
+            assert diagram.is_side_room(a.location)
             if self.at_destination(a):
                 return
-            if self.side_room_to_hallway_blocked(a):
-                return
 
-            for loc in self.side_room_to_hallway_locations(a):
-                yield loc
+            for stop, (_, between) in diagram.routes[index].items():
+                if not self._occupied & (between | 1 << stop):
+                    yield diagram.locations[stop]
 
     def side_room_ready(self, a: Amphipod) -> bool:
         assert a.location in self.diagram.valid_hallway_locations
@@ -187,70 +235,12 @@ class Board:
             self._loc_lookup.get(loc, a).type == a.type for loc in side_room_locs
         )
 
-    def hallway_path_to_side_room_blocked(self, a: Amphipod) -> bool:
-        assert a.location in self.diagram.valid_hallway_locations
-        side_room_locs = self.diagram.side_rooms[a.type]
-
-        y_amphipod = a.location[1]
-
-        # Extract y coordiante for the hallway above the side room.
-        y_side_room = next(iter(side_room_locs))[1]
-
-        # Find hallway space above side room for amphipod type.
-        idx = bisect.bisect_left(
-            self.diagram.hallway_locations, y_side_room, key=lambda loc: loc[1]
-        )
-
-        delta = abs(y_amphipod - y_side_room)
-        if y_side_room < a.location[1]:
-            # Amphipod is right of the side room.
-            start = idx + 1
-            end = idx + delta
-        else:
-            # Otherwise, left of the side room.
-            start = idx - delta + 1
-            end = idx
-
-        return any(
-            loc in self._loc_lookup for loc in self.diagram.hallway_locations[start:end]
-        )
-
     def side_room_available_location(self, a: Amphipod) -> Coordinate:
         side_room_locs = self.diagram.side_rooms[a.type]
         return next(
             filter(lambda x: x not in self._loc_lookup, reversed(side_room_locs))
         )
 
-    def side_room_to_hallway_blocked(self, a: Amphipod) -> bool:
-        side_room_locs = self.diagram.side_rooms[self.diagram.hallway_type(a.location)]
-        locs_above = list(takewhile(lambda x: x != a.location, side_room_locs))
-        if not locs_above:
-            return False
-        return any(loc in self._loc_lookup for loc in locs_above)
-
-    def side_room_to_hallway_locations(self, a: Amphipod) -> Iterable[Coordinate]:
-        # Find hallway space above side room.
-        idx = bisect.bisect_left(
-            self.diagram.hallway_locations, a.location[1], key=lambda x: x[1]
-        )
-
-        left_locs = takewhile(
-            lambda x: x not in self._loc_lookup,
-            filter(
-                lambda x: x in self.diagram.valid_hallway_locations,
-                reversed(self.diagram.hallway_locations[:idx]),
-            ),
-        )
-        right_locs = takewhile(
-            lambda x: x not in self._loc_lookup,
-            filter(
-                lambda x: x in self.diagram.valid_hallway_locations,
-                self.diagram.hallway_locations[idx + 1 :],
-            ),
-        )
-
-        return chain(left_locs, right_locs)
-
     def at_destination(self, a: Amphipod) -> bool:
         dest_locs = self.diagram.side_rooms[a.type]
         return a.location in dest_locs and all(
@@ -285,7 +275,12 @@ def states(board: Board) -> Iterator[tuple[Amphipods, int]]:
             }, energy
 
 
-def lowest_energy(init: Board) -> int:
+@dataclass
+class SearchStats:
+    expanded: int = 0
+
+
+def lowest_energy(init: Board, stats: SearchStats | None = None) -> int:
     # Return the lowest energy to organize the amphipods in sorted order from
     # left-to-right.
     hq = [(0, init.amphipods)]
@@ -293,6 +288,8 @@ def lowest_energy(init: Board) -> int:
     while hq:
         energy, amphipods = heapq.heappop(hq)
         board = Board(init.diagram, amphipods)
+        if stats is not None:
+            stats.expanded += 1
 
         if board.is_organized():
             return energy
@@ -303,16 +300,367 @@ def lowest_energy(init: Board) -> int:
                 seen_states[amphipods] = new_energy
                 heapq.heappush(hq, (new_energy, amphipods))
 
-    raise AssertionError("Amphipods should have been organized!")
+    # The amphipods can never be organized.
+    return sys.maxsize
+
+
+# The packed board is one byte per hallway location, from left to right,
+# followed by one per side room location, from the first side room's top to the
+# last's bottom.  Each byte is EMPTY or the amphipod's type's index plus one.
+EMPTY = 0
+AMPHIPOD_TYPES = list(AmphipodType)
+AMPHIPOD_CODES = {atype: i + 1 for i, atype in enumerate(AMPHIPOD_TYPES)}
+CODE_COSTS = [0] + [MOVE_COST[atype] for atype in AMPHIPOD_TYPES]
+
+
+def pack_board(board: Board) -> bytes:
+    diagram = board.diagram
+    packed = bytearray(len(diagram.locations))
+    for a in board.amphipods:
+        packed[diagram.location_index[a.location]] = AMPHIPOD_CODES[a.type]
+    return bytes(packed)
+
+
+def packed_lowest_energy(init: Board, stats: SearchStats | None = None) -> int:
+    diagram = init.diagram
+    hallway = len(diagram.hallway_locations)
+    depth = len(diagram.side_rooms[AmphipodType.AMBER])
+    routes = diagram.routes
+    stops = sorted(
+        diagram.location_index[loc] for loc in diagram.valid_hallway_locations
+    )
+    # Hallway index above each side room and the side room's locations, by
+    # code.
+    doors = [-1] + [diagram.side_room_doors[atype] for atype in AMPHIPOD_TYPES]
+    room_masks = [0] + [diagram.side_room_masks[atype] for atype in AMPHIPOD_TYPES]
+    # Code of the side room each location is in, and how many steps it is below
+    # the hallway.
+    location_rooms = bytes(hallway) + bytes(
+        code for code in range(1, len(AMPHIPOD_TYPES) + 1) for _ in range(depth)
+    )
+    location_depths = bytes(hallway) + bytes(range(1, depth + 1)) * len(AMPHIPOD_TYPES)
+    goal = bytes(hallway) + location_rooms[hallway:]
+
+    def occupancy(board: bytes) -> tuple[int, int]:
+        # Locations that are occupied, and side room locations occupied by an
+        # amphipod that doesn't belong there.
+        occupied = 0
+        foreign = 0
+        for i, code in enumerate(board):
+            if code != EMPTY:
+                occupied |= 1 << i
+                if location_rooms[i] and code != location_rooms[i]:
+                    foreign |= 1 << i
+        return occupied, foreign
+
+    def move(
+        board: bytes, occupied: int, foreign: int, src: int, dest: int
+    ) -> tuple[bytes, int, int]:
+        code = board[src]
+        packed = bytearray(board)
+        packed[src], packed[dest] = EMPTY, code
+        occupied ^= 1 << src | 1 << dest
+        foreign &= ~(1 << src)
+        if location_rooms[dest] and code != location_rooms[dest]:
+            foreign |= 1 << dest
+        return bytes(packed), occupied, foreign
+
+    def min_energy_left(board: bytes, foreign: int) -> int:
+        # Energy to move each amphipod into its side room, ignoring other
+        # amphipods in the way.  Amphipods entering the same side room fill
+        # it from the top down, so each goes one step further than the last.
+        energy = 0
+        entering = [0] * len(doors)
+        for i in range(hallway):
+            code = board[i]
+            if code != EMPTY:
+                energy += (abs(i - doors[code]) + 1) * CODE_COSTS[code]
+                entering[code] += 1
+        for i in range(hallway, len(board)):
+            code = board[i]
+            room_code = location_rooms[i]
+            if code == EMPTY:
+                continue
+            if code == room_code and not foreign & room_masks[code] >> i << i:
+                # Settled, with only amphipods that belong here below.
+                continue
+            # Amphipods in their own side room need to step out of the way.
+            sideways = abs(doors[room_code] - doors[code]) or 2
+            energy += (location_depths[i] + sideways + 1) * CODE_COSTS[code]
+            entering[code] += 1
+        for code, n in enumerate(entering):
+            energy += (n * (n - 1) // 2) * CODE_COSTS[code]
+        return energy
+
+    def home_move(
+        board: bytes, occupied: int, foreign: int
+    ) -> tuple[int, int, int] | None:
+        # An amphipod that can go straight into its side room, as where it is,
+        # where it goes, and the steps to get there.
+        for i in range(hallway):
+            code = board[i]
+            if code == EMPTY or foreign & room_masks[code]:
+                continue
+            # Side rooms fill from the bottom, which is the highest index.
+            dest = (room_masks[code] & ~occupied).bit_length() - 1
+            steps, between = routes[dest][i]
+            if not occupied & between:
+                return i, dest, steps
+
+        for room_code in range(1, len(doors)):
+            if not foreign & room_masks[room_code]:
+                continue
+            room_occupied = occupied & room_masks[room_code]
+            src = (room_occupied & -room_occupied).bit_length() - 1
+            code = board[src]
+            if code == room_code or foreign & room_masks[code]:
+                continue
+            lo, hi = sorted((doors[room_code], doors[code]))
+            if occupied & ((1 << hi + 1) - (1 << lo)):
+                continue
+            dest = (room_masks[code] & ~occupied).bit_length() - 1
+            return src, dest, location_depths[src] + hi - lo + location_depths[dest]
+
+        return None
+
+    def deadlocked(board: bytes, occupied: int, foreign: int, stop: int) -> bool:
+        # Whether the amphipod just moved into the hallway at stop can never be
+        # organized, along with the amphipods around it.
+        code = board[stop]
+        door = doors[code]
+        step = 1 if door > stop else -1
+
+        # Hallway amphipods can only move into their side room, so two that
+        # are each in the other's way never move again.
+        for i in range(stop + step, door, step):
+            if board[i] != EMPTY and (doors[board[i]] - stop) * step < 0:
+                return True
+
+        # A side room holding amphipods that don't belong there can never
+        # drain when there is nowhere in the hallway to move them to, and the
+        # amphipods closing it off on both sides are waiting to get into it.
+        if not foreign & room_masks[code]:
+            return False
+        left = door - 1
+        while left >= 0 and not occupied >> left & 1:
+            left -= 1
+        right = door + 1
+        while right < hallway and not occupied >> right & 1:
+            right += 1
+        return (
+            (left < 0 or board[left] == code)
+            and (right == hallway or board[right] == code)
+            and not any(left < i < right for i in stops)
+        )
+
+    def moves(
+        board: bytes, occupied: int, foreign: int
+    ) -> Iterator[tuple[bytes, int, int, int]]:
+        # Moving an amphipod into its side room is part of a best solution
+        # whenever it is possible, so make that move without branching.
+        forced = home_move(board, occupied, foreign)
+        if forced is not None:
+            src, dest, steps = forced
+            energy = steps * CODE_COSTS[board[src]]
+            yield *move(board, occupied, foreign, src, dest), energy
+            return
+
+        # Side room to hallway.
+        for room_code in range(1, len(doors)):
+            if not foreign & room_masks[room_code]:
+                # Empty, or only amphipods that belong here.
+                continue
+            room_occupied = occupied & room_masks[room_code]
+            src = (room_occupied & -room_occupied).bit_length() - 1
+            energy = CODE_COSTS[board[src]]
+            for stop, (steps, between) in routes[src].items():
+                if occupied & (between | 1 << stop):
+                    continue
+                next_board, next_occupied, next_foreign = move(
+                    board, occupied, foreign, src, stop
+                )
+                if not deadlocked(next_board, next_occupied, next_foreign, stop):
+                    yield next_board, next_occupied, next_foreign, steps * energy
+
+    # A* search, where the minimum energy left never overestimates.
+    start = pack_board(init)
+    occupied, foreign = occupancy(start)
+    hq = [(min_energy_left(start, foreign), 0, start, occupied, foreign)]
+    seen_states: dict[bytes, int] = {start: 0}
+    while hq:
+        _, energy, board, occupied, foreign = heapq.heappop(hq)
+        if energy > seen_states[board]:
+            continue
+        if stats is not None:
+            stats.expanded += 1
+
+        if board == goal:
+            return energy
+
+        for next_board, next_occupied, next_foreign, move_energy in moves(
+            board, occupied, foreign
+        ):
+            new_energy = energy + move_energy
+            if new_energy < seen_states.get(next_board, sys.maxsize):
+                seen_states[next_board] = new_energy
+                heapq.heappush(
+                    hq,
+                    (
+                        new_energy + min_energy_left(next_board, next_foreign),
+                        new_energy,
+                        next_board,
+                        next_occupied,
+                        next_foreign,
+                    ),
+                )
+
+    # The amphipods can never be organized.
+    return sys.maxsize
+
+
+SOLVERS = {
+    "dijkstra": lowest_energy,
+    "astar": packed_lowest_energy,
+}
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--solver",
+    choices=SOLVERS.keys(),
+    default="astar",
+    help="search implementation",
+)
+parser.add_argument(
+    "--stats",
+    action="store_true",
+    help="report the number of states expanded",
+)
+parser.add_argument(
+    "--depth",
+    type=int,
+    action="append",
+    default=[],
+    help="also solve with DEPTH amphipods in each side room",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+
+
+def solve(diagram_input: list[str]) -> int:
+    stats = SearchStats()
+    energy = SOLVERS[args.solver](Board(*parse_diagram(diagram_input)), stats)
+    if args.stats:
+        print("States expanded:", stats.expanded)
+    return energy
+
+
+def unfold_diagram(raw_diagram: list[str], depth: int) -> list[str]:
+    # Unfold the side rooms between their first and last rows.  Repeating the
+    # folded rows leaves too little room to organize deeper side rooms, so those
+    # diagrams are scrambled from organized ones instead of unfolded.
+    if depth > len(FOLDED_ROWS) + 2:
+        return scramble_diagram(depth, random.Random(depth))
+    unfolded_rows = FOLDED_ROWS[: depth - 2]
+    return raw_diagram[:FOLD_INDEX] + unfolded_rows + raw_diagram[FOLD_INDEX:]
+
+
+def scramble_diagram(depth: int, rng: random.Random) -> list[str]:
+    # Walk backwards from the organized diagram, so that the amphipods can
+    # always retrace their steps.  Backwards, an amphipod leaves the top of its
+    # home side room if only its own type is beneath it, and an amphipod in the
+    # hallway enters the top of any side room with space.  Amphipods return to
+    # their organized side room only when nothing else can move, and a walk
+    # ends if the hallway jams.
+    doors = [2 * (i + 1) for i in range(len(AMPHIPOD_TYPES))]
+    stops = [x for x in range(2 * len(AMPHIPOD_TYPES) + 3) if x not in doors]
+    hallway: list[str] = []
+    rooms: list[list[AmphipodType]] = []
+
+    def clear(a: int, b: int) -> bool:
+        return all(
+            hallway[x] == SpaceType.OPEN for x in range(min(a, b), max(a, b) + 1)
+        )
+
+    def settled(i: int) -> bool:
+        return all(atype == AMPHIPOD_TYPES[i] for atype in rooms[i])
+
+    def backward_moves() -> list[list[tuple[int, int]]]:
+        # As (hallway stop, side room) pairs of amphipods leaving, entering and
+        # returning to their settled side room, which undoes the scrambling.
+        leaving: list[tuple[int, int]] = []
+        entering: list[tuple[int, int]] = []
+        returning: list[tuple[int, int]] = []
+        for i, room in enumerate(rooms):
+            if room and settled(i):
+                leaving.extend((x, i) for x in stops if clear(x, doors[i]))
+            if len(room) == depth:
+                continue
+            for x in stops:
+                if hallway[x] == SpaceType.OPEN or not clear(
+                    x + (1 if x < doors[i] else -1), doors[i]
+                ):
+                    continue
+                if hallway[x] == AMPHIPOD_TYPES[i] and settled(i):
+                    returning.append((x, i))
+                else:
+                    entering.append((x, i))
+        return [leaving, entering, returning]
+
+    scrambled, most_misplaced = [[atype] * depth for atype in AMPHIPOD_TYPES], 0
+    for _ in range(SCRAMBLE_WALKS):
+        hallway = [SpaceType.OPEN] * (len(stops) + len(doors))
+        rooms = [[atype] * depth for atype in AMPHIPOD_TYPES]
+        for _ in range(SCRAMBLE_STEPS):
+            leaving, entering, returning = backward_moves()
+            if not (choices := [moves for moves in (leaving, entering) if moves]):
+                choices = [returning] if returning else []
+            if not choices:
+                break
+            x, i = rng.choice(rng.choice(choices))
+            if hallway[x] == SpaceType.OPEN:
+                hallway[x] = rooms[i].pop(0)
+                continue
+            rooms[i].insert(0, AmphipodType(hallway[x]))
+            hallway[x] = SpaceType.OPEN
+
+            # Keep the most scrambled side rooms with an empty hallway.
+            misplaced = sum(
+                atype != AMPHIPOD_TYPES[i]
+                for i, room in enumerate(rooms)
+                for atype in room
+            )
+            if misplaced > most_misplaced and all(
+                space == SpaceType.OPEN for space in hallway
+            ):
+                scrambled = [room.copy() for room in rooms]
+                most_misplaced = misplaced
+
+    rows = ["#".join(room[row] for room in scrambled) for row in range(depth)]
+    return (
+        ["#" * (len(hallway) + 2), "#" + SpaceType.OPEN * len(hallway) + "#"]
+        + ["###" + rows[0] + "###"]
+        + ["  #" + row + "#  " for row in rows[1:]]
+        + ["  " + "#" * (len(hallway) - 2) + "  "]
+    )
 
-diagram_input = [line.rstrip("\n") for line in fileinput.input()]
-print("Part 1:", lowest_energy(Board(*parse_diagram(diagram_input))))
 
 FOLD_INDEX = 3
-diagram_input[FOLD_INDEX:FOLD_INDEX] = [
+FOLDED_ROWS = [
     "  #D#C#B#A#  ",
     "  #D#B#A#C#  ",
 ]
+# Walks, and backward moves per walk, to try when scrambling deeper diagrams.
+SCRAMBLE_WALKS = 200
+SCRAMBLE_STEPS = 50
+
+diagram_input = [line.rstrip("\n") for line in fileinput.input(args.files)]
+for depth in args.depth:
+    if depth < 2:
+        parser.error(f"depth {depth} is less than the folded depth of 2")
+
+print("Part 1:", solve(diagram_input))
+print("Part 2:", solve(unfold_diagram(diagram_input, 4)))
 
-print("Part 2:", lowest_energy(Board(*parse_diagram(diagram_input))))
+for depth in args.depth:
+    energy = solve(unfold_diagram(diagram_input, depth))
+    print(f"Depth {depth}:", energy if energy != sys.maxsize else "no solution")
@@ -68,16 +68,27 @@ For the largest model number, we know one digit must be 9, and the other will
 be 9 - {DELTA} if DELTA > 0 else 9 + {DELTA}.
 """
 
+import argparse
 from collections import deque
 from dataclasses import dataclass
 from enum import IntEnum
 from enum import StrEnum
 import fileinput
+from typing import Any
+from typing import Callable
 from typing import cast
 from typing import Iterable
 from typing import Sequence
 from typing import TypeVar
 
+try:
+    import numpy as np
+    import numpy.typing as npt
+
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
 
 class InstructionType(StrEnum):
     INPUT = "inp"
@@ -131,10 +142,153 @@ def input2instruction(x: str) -> Instruction:
     )
 
 
-monad_program_input = [input2instruction(line.rstrip()) for line in fileinput.input()]
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--solver",
+    choices=("constraints", "search"),
+    default="constraints",
+    help="model number solver: from the template's constraints or a search",
+)
+parser.add_argument(
+    "--engine",
+    choices=("python", "numpy"),
+    default="numpy" if HAVE_NUMPY else "python",
+    help="ALU implementation for searching model numbers",
+)
+parser.add_argument(
+    "--search",
+    type=int,
+    nargs=2,
+    action="append",
+    default=[],
+    metavar=("LOW", "HIGH"),
+    help="also run MONAD on every model number from LOW to HIGH",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+
+if args.engine == "numpy" and not HAVE_NUMPY:
+    parser.error("the numpy engine requires numpy")
+
+monad_program_input = [
+    input2instruction(line.rstrip()) for line in fileinput.input(args.files)
+]
 
 NUM_DIGITS = 14
 BASE = 26
+MIN_MODEL_NUMBER = 10 ** (NUM_DIGITS - 1)
+MAX_MODEL_NUMBER = 10**NUM_DIGITS - 1
+
+for low, high in args.search:
+    if not MIN_MODEL_NUMBER <= low <= high <= MAX_MODEL_NUMBER:
+        parser.error(
+            f"search {low}..{high} isn't a range of {NUM_DIGITS} digit model numbers"
+        )
+BATCH_SIZE = 1 << 14
+
+# Registers w, x, y, and z after running a program.
+Registers = tuple[Any, Any, Any, Any]
+
+
+def alu_source(program: list[Instruction]) -> str:
+    # Python source for a function running the program on a sequence of
+    # inputs, starting from the given z register.  Division and equality go
+    # through alu_div and alu_eql, so the same source runs on ints or on NumPy
+    # arrays of inputs.
+    lines = ["def run(inputs, z=0):", "    w = x = y = 0"]
+    inputs = 0
+    for instruction in program:
+        a = instruction.a.value
+        b = str(instruction.b)
+        match instruction.type:
+            case InstructionType.INPUT:
+                lines.append(f"    {a} = inputs[{inputs}]")
+                inputs += 1
+            case InstructionType.ADD:
+                lines.append(f"    {a} = {a} + {b}")
+            case InstructionType.MULTIPLY:
+                lines.append(f"    {a} = {a} * {b}")
+            case InstructionType.DIVIDE:
+                lines.append(f"    {a} = alu_div({a}, {b})")
+            case InstructionType.MODULO:
+                lines.append(f"    {a} = {a} % {b}")
+            case InstructionType.EQUAL:
+                lines.append(f"    {a} = alu_eql({a}, {b})")
+    lines.append("    return w, x, y, z")
+    return "\n".join(lines)
+
+
+def alu_div(a: int, b: int) -> int:
+    # XXX: The ALU truncates towards zero.
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def alu_eql(a: int, b: int) -> int:
+    return int(a == b)
+
+
+def numpy_alu_div(a: Any, b: Any) -> "npt.NDArray[np.int64]":
+    result: npt.NDArray[np.int64] = np.where(
+        (np.asarray(a) < 0) == (np.asarray(b) < 0), 1, -1
+    ) * (np.abs(a) // np.abs(b))
+    return result
+
+
+def numpy_alu_eql(a: Any, b: Any) -> "npt.NDArray[np.int64]":
+    result: npt.NDArray[np.int64] = (np.asarray(a) == b).astype(np.int64)
+    return result
+
+
+ALU = Callable[..., Registers]
+
+
+def compile_program(program: list[Instruction], engine: str = "python") -> ALU:
+    namespace: dict[str, Any]
+    if engine == "numpy":
+        namespace = {"alu_div": numpy_alu_div, "alu_eql": numpy_alu_eql}
+    else:
+        namespace = {"alu_div": alu_div, "alu_eql": alu_eql}
+    exec(alu_source(program), namespace)
+    return cast(ALU, namespace["run"])
+
+
+def model_number_digits(model_number: int) -> list[int]:
+    return list(map(int, str(model_number)))
+
+
+def is_valid_model_number(run: ALU, model_number: int) -> bool:
+    digits = model_number_digits(model_number)
+    if len(digits) != NUM_DIGITS:
+        return False
+    *_, z = run(digits)
+    return bool(z == 0)
+
+
+def search_model_numbers(
+    program: list[Instruction], low: int, high: int, engine: str
+) -> list[int]:
+    # Every valid model number from low to high, skipping numbers with a zero
+    # digit, which MONAD doesn't accept.
+    run = compile_program(program, engine)
+    if engine != "numpy":
+        return [
+            model_number
+            for model_number in range(low, high + 1)
+            if "0" not in str(model_number) and is_valid_model_number(run, model_number)
+        ]
+
+    place_values = 10 ** np.arange(NUM_DIGITS - 1, -1, -1, dtype=np.int64)
+    valid = []
+    for start in range(low, high + 1, BATCH_SIZE):
+        model_numbers = np.arange(
+            start, min(start + BATCH_SIZE, high + 1), dtype=np.int64
+        )
+        digits = model_numbers[:, np.newaxis] // place_values % 10
+        with_digits = (digits != 0).all(axis=1)
+        *_, z = run(digits[with_digits].T)
+        valid.extend(model_numbers[with_digits][z == 0].tolist())
+    return valid
 
 
 class InstructionLine(IntEnum):
@@ -174,10 +328,6 @@ def extract_constraints(program: list[Instruction]) -> Sequence[Constraint]:
     return constraints
 
 
-constraints = extract_constraints(monad_program_input)
-assert len(constraints) == NUM_DIGITS // 2
-
-
 def largest_model_number(constraints: Iterable[Constraint]) -> int:
     digits = [0] * NUM_DIGITS
 
@@ -194,9 +344,6 @@ def largest_model_number(constraints: Iterable[Constraint]) -> int:
     return int("".join(map(str, digits)))
 
 
-print("Part 1:", largest_model_number(constraints))
-
-
 def smallest_model_number(constraints: Iterable[Constraint]) -> int:
     digits = [0] * NUM_DIGITS
 
@@ -213,4 +360,95 @@ def smallest_model_number(constraints: Iterable[Constraint]) -> int:
     return int("".join(map(str, digits)))
 
 
-print("Part 2:", smallest_model_number(constraints))
+def split_blocks(program: list[Instruction]) -> list[list[Instruction]]:
+    blocks: list[list[Instruction]] = []
+    for instruction in program:
+        if instruction.type == InstructionType.INPUT:
+            blocks.append([])
+        blocks[-1].append(instruction)
+    return blocks
+
+
+def carries_only_z(block: list[Instruction]) -> bool:
+    # Whether the block sets w, x, and y before using them, so z is the only
+    # register carried over from the block before.
+    written = {ALURegister.z}
+    for instruction in block:
+        a = instruction.a
+        b = instruction.b
+        if instruction.type == InstructionType.INPUT or (
+            instruction.type == InstructionType.MULTIPLY and b == 0
+        ):
+            written.add(a)
+            continue
+        if a not in written or (isinstance(b, ALURegister) and b not in written):
+            return False
+    return True
+
+
+def search_model_number(
+    program: list[Instruction], digit_order: Sequence[int]
+) -> int | None:
+    # Choose digits in order, block by block, running each block on the z
+    # register left by the ones before.  Remember the (block, z) states that
+    # lead nowhere.
+    blocks = split_blocks(program)
+    assert all(map(carries_only_z, blocks))
+    runs = [compile_program(block) for block in blocks]
+
+    # XXX: Assume z only ever shrinks by division; thus, z needs to be less
+    # than the product of the divisors of the remaining blocks to reach 0.
+    z_bounds = [1] * (len(blocks) + 1)
+    for i in reversed(range(len(blocks))):
+        z_bounds[i] = z_bounds[i + 1]
+        for instruction in blocks[i]:
+            if (
+                instruction.type == InstructionType.DIVIDE
+                and instruction.a == ALURegister.z
+                and isinstance(instruction.b, int)
+            ):
+                z_bounds[i] *= abs(instruction.b)
+
+    dead_ends: set[tuple[int, int]] = set()
+
+    def search(block: int, z: int) -> list[int] | None:
+        if block == len(blocks):
+            return [] if z == 0 else None
+        if z >= z_bounds[block] or (block, z) in dead_ends:
+            return None
+        for digit in digit_order:
+            *_, next_z = runs[block]([digit], z)
+            digits = search(block + 1, next_z)
+            if digits is not None:
+                return [digit] + digits
+        dead_ends.add((block, z))
+        return None
+
+    digits = search(0, 0)
+    return int("".join(map(str, digits))) if digits is not None else None
+
+
+largest: int | None
+smallest: int | None
+if args.solver == "constraints":
+    constraints = extract_constraints(monad_program_input)
+    assert len(constraints) == NUM_DIGITS // 2
+    largest = largest_model_number(constraints)
+    smallest = smallest_model_number(constraints)
+else:
+    largest = search_model_number(monad_program_input, range(9, 0, -1))
+    smallest = search_model_number(monad_program_input, range(1, 10))
+
+monad = compile_program(monad_program_input)
+assert largest is not None and is_valid_model_number(monad, largest)
+assert smallest is not None and is_valid_model_number(monad, smallest)
+print("Part 1:", largest)
+print("Part 2:", smallest)
+
+for low, high in args.search:
+    valid = search_model_numbers(monad_program_input, low, high, args.engine)
+    print(
+        f"Search {low}..{high}:",
+        len(valid),
+        "valid" + (f" ({min(valid)}..{max(valid)})" if valid else ""),
+    )
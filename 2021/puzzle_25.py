@@ -1,3 +1,4 @@
+import argparse
 from enum import StrEnum
 import fileinput
 from typing import Iterable
@@ -12,9 +13,19 @@ Location = SeaCucumberHerdType | None
 SeaMap = list[list[Location]]
 
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--engine",
+    choices=("bitboard", "grid"),
+    default="bitboard",
+    help="sea cucumber map representation",
+)
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+
 sea_map: SeaMap = [
     [None if x == "." else SeaCucumberHerdType(x) for x in line.rstrip()]
-    for line in fileinput.input()
+    for line in fileinput.input(args.files)
 ]
 
 Coordinate = tuple[int, int]
@@ -63,4 +74,59 @@ def steps_until_no_movement(m: SeaMap) -> int:
     return steps
 
 
-print("Part 1:", steps_until_no_movement(sea_map))
+def herd_bitboard(m: SeaMap, t: SeaCucumberHerdType) -> list[int]:
+    # One int per row, where bit j is set if the herd is in column j.
+    return [sum(1 << j for j, x in enumerate(row) if x == t) for row in m]
+
+
+def bitboard_steps_until_no_movement(m: SeaMap) -> int:
+    rows = len(m)
+    cols = len(m[0])
+    row_mask = (1 << cols) - 1
+    east = herd_bitboard(m, SeaCucumberHerdType.EAST)
+    south = herd_bitboard(m, SeaCucumberHerdType.SOUTH)
+
+    def next_cols(bits: int) -> int:
+        # Move every bit one column east, wrapping around the row.
+        return ((bits << 1) | (bits >> (cols - 1))) & row_mask
+
+    def prev_cols(bits: int) -> int:
+        # Move every bit one column west, wrapping around the row.
+        return ((bits >> 1) | (bits << (cols - 1))) & row_mask
+
+    steps = 0
+    while True:
+        steps += 1
+        moved = False
+
+        for i in range(rows):
+            # East-facing sea cucumbers with nothing in the column to the east.
+            movers = east[i] & ~prev_cols(east[i] | south[i])
+            if movers:
+                east[i] ^= movers | next_cols(movers)
+                moved = True
+
+        # Find all south-facing movers before moving any, since they all move
+        # at the same time.
+        south_movers = [
+            south[i] & ~(east[(i + 1) % rows] | south[(i + 1) % rows])
+            for i in range(rows)
+        ]
+        for i, movers in enumerate(south_movers):
+            if movers:
+                south[i] ^= movers
+                south[(i + 1) % rows] |= movers
+                moved = True
+
+        if not moved:
+            break
+
+    return steps
+
+
+ENGINES = {
+    "bitboard": bitboard_steps_until_no_movement,
+    "grid": steps_until_no_movement,
+}
+
+print("Part 1:", ENGINES[args.engine](sea_map))